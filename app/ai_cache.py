@@ -0,0 +1,255 @@
+"""
+AI Response Cache
+In-process TTL/LRU cache and optional semantic cache for AI provider responses
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+
+# Optional dependencies for the semantic cache
+try:
+    import numpy as np
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    faiss = None
+    SentenceTransformer = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(**parts):
+    """
+    Build a stable cache key from request parts
+
+    Args:
+        **parts: JSON-serializable values that identify a request
+                 (model, prompt, context, messages, tools, ...)
+
+    Returns: str with SHA256 hex digest
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """Thread-safe TTL cache for AI responses"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached value for key, or None on miss"""
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key, value):
+        """Store value under key"""
+        with self._lock:
+            self._cache[key] = value
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._cache.clear()
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into a single execution"""
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn once per key at a time
+        Callers arriving while fn runs wait for and share its result (or exception)
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result(timeout=timeout)
+
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache for paraphrased prompts
+    Every entry carries an exact scope key (provider, model, token budget, context, user);
+    a similar prompt only hits when its scope matches too
+    Requires sentence-transformers and faiss-cpu; disabled otherwise
+    """
+
+    # Nearest neighbours checked for an entry in the caller's scope
+    SEARCH_K = 8
+
+    def __init__(self, enabled=False, cache_dir=None, model_name='all-MiniLM-L6-v2',
+                 threshold=0.92, max_entries=10000, save_every=50, save_interval=60):
+        self.enabled = enabled and SentenceTransformer is not None and faiss is not None
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self._model = None
+        self._index = None
+        self._entries = []  # [scope, response] per index row
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+        if enabled and not self.enabled:
+            logger.warning("Semantic cache requested but sentence-transformers/faiss-cpu are not installed")
+
+    def _index_paths(self):
+        return (os.path.join(self.cache_dir, 'semantic_cache.faiss'),
+                os.path.join(self.cache_dir, 'semantic_cache.json'))
+
+    def _load(self):
+        """Load the embedding model and FAISS index on first use"""
+        if self._model is not None:
+            return
+
+        self._model = SentenceTransformer(self.model_name)
+        dimension = self._model.get_sentence_embedding_dimension()
+
+        if self.cache_dir:
+            index_path, responses_path = self._index_paths()
+            if os.path.exists(index_path) and os.path.exists(responses_path):
+                with open(responses_path) as f:
+                    entries = json.load(f)
+                # Indexes written before entries were scoped cannot be matched safely
+                if all(isinstance(entry, list) for entry in entries):
+                    self._index = faiss.read_index(index_path)
+                    self._entries = entries
+                    return
+
+        self._index = faiss.IndexFlatIP(dimension)
+
+    def _save(self):
+        """Persist the FAISS index and entries so the cache survives restarts"""
+        if not self.cache_dir or not self._unsaved:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_path, responses_path = self._index_paths()
+        faiss.write_index(self._index, index_path)
+        with open(responses_path, 'w') as f:
+            json.dump(self._entries, f)
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def _maybe_save(self):
+        """Rewrite the index after save_every inserts or save_interval seconds, not on every insert"""
+        if (self._unsaved >= self.save_every
+                or time.monotonic() - self._last_save >= self.save_interval):
+            self._save()
+
+    def flush(self):
+        """Persist inserts not yet written to disk"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                if self._index is not None:
+                    self._save()
+        except Exception:
+            logger.exception("Semantic cache save failed")
+
+    def _embed(self, prompt):
+        embedding = self._model.encode([prompt], normalize_embeddings=True)
+        return np.asarray(embedding, dtype='float32')
+
+    def lookup(self, prompt, scope, threshold=None):
+        """Return cached response for a similar prompt in the same scope, or None on miss"""
+        if not self.enabled:
+            return None
+
+        try:
+            with self._lock:
+                self._load()
+                if self._index.ntotal == 0:
+                    return None
+
+            embedding = self._embed(prompt)
+
+            with self._lock:
+                scores, ids = self._index.search(embedding, min(self.SEARCH_K, self._index.ntotal))
+                neighbours = [(score, self._entries[i]) for score, i in zip(scores[0], ids[0]) if i >= 0]
+
+            # Neighbours come best first
+            for score, (entry_scope, response) in neighbours:
+                if score < (threshold or self.threshold):
+                    break
+                if entry_scope == scope:
+                    return response
+            return None
+
+        except Exception:
+            logger.exception("Semantic cache lookup failed")
+            return None
+
+    def add(self, prompt, response, scope):
+        """Store response under the embedding of prompt, for lookups with the same scope"""
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                self._load()
+                if self._index.ntotal >= self.max_entries:
+                    return
+
+            embedding = self._embed(prompt)
+
+            with self._lock:
+                self._index.add(embedding)
+                self._entries.append([scope, response])
+                self._unsaved += 1
+                self._maybe_save()
+
+        except Exception:
+            logger.exception("Semantic cache update failed")
+
+
+# Shared cache used by all provider instances
+response_cache = LLMCache(
+    maxsize=int(os.getenv('AI_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('AI_CACHE_TTL', 3600))
+)
+
+semantic_cache = SemanticCache(
+    enabled=os.getenv('AI_SEMANTIC_CACHE', 'false').lower() == 'true',
+    cache_dir=os.getenv('AI_SEMANTIC_CACHE_DIR'),
+    threshold=float(os.getenv('AI_SEMANTIC_CACHE_THRESHOLD', 0.92))
+)
+atexit.register(semantic_cache.flush)
@@ -4,10 +4,100 @@ Supports Claude (Anthropic), OpenAI, and Ollama providers
 """
 
 from abc import ABC, abstractmethod
-import anthropic
-from openai import OpenAI
+import httpx
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from cachetools import LRUCache
+from ai_cache import response_cache, semantic_cache, make_cache_key, SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bound on model turns in one tool-calling conversation
+MAX_TOOL_TURNS = 8
+
+# Seconds a coalesced caller waits for the in-flight request it joined
+INFLIGHT_WAIT_TIMEOUT = 120
+
+# Default output token budget; callers needing long answers opt in to more
+DEFAULT_MAX_TOKENS = 512
+
+# How long Ollama keeps the model loaded after each request
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '1h')
+
+# Max concurrent upstream requests per generate_response_batch call
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 8))
+
+# HTTP statuses worth retrying (rate limited / transient server errors)
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_MAX_RETRY_AFTER = 30
+
+
+def _is_retryable(error):
+    """Check if an SDK/HTTP error is transient"""
+    timeout_errors = [requests.exceptions.Timeout, httpx.TimeoutException]
+    # SDKs are imported lazily; only check the ones that are loaded
+    for module_name in ('anthropic', 'openai'):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            timeout_errors.append(module.APITimeoutError)
+
+    if isinstance(error, tuple(timeout_errors)):
+        return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in _RETRYABLE_STATUS
+
+
+def _retry_delay(error, attempt, base):
+    """Backoff delay, honoring a Retry-After header when the server sends one"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return min(float(retry_after), _MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return base * 2 ** attempt + random.uniform(0, 0.25)
+
+
+def _retry(fn, *, retries=4, base=0.5):
+    """
+    Call fn, retrying transient failures with exponential backoff and jitter
+    Re-raises the last error when retries are exhausted or the error is not transient
+    """
+    for attempt in range(retries):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries - 1 or not _is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt, base))
+
+
+async def _aretry(fn, *, retries=4, base=0.5):
+    """Async variant of _retry; fn returns an awaitable"""
+    for attempt in range(retries):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == retries - 1 or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt, base))
+
+
+class AIToolLoopError(Exception):
+    """Raised when a tool-calling conversation cannot be completed"""
+    pass
 
 
 class BaseAIProvider(ABC):
@@ -15,6 +105,119 @@ class BaseAIProvider(ABC):
 
     def __init__(self):
         self.supports_tool_calling = False  # Subclasses override this
+        self._cache = response_cache
+        self._sem_cache = semantic_cache
+        self._inflight = SingleFlight()
+
+    def _response_cache_key(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """Return cache_key identifying a plain generation request"""
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+        return make_cache_key(m=self.model, p=full_prompt, c=context, t=max_tokens)
+
+    def _semantic_lookup(self, semantic, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        Resolve a caller's semantic cache opt-in
+        Args:
+            semantic: (user_scope, question) or None; user_scope must cover any user data in the prompt
+        Returns: (scope, question) where scope also pins provider, model, token budget and context,
+                 or None to skip the semantic cache
+        """
+        if semantic is None:
+            return None
+        user_scope, question = semantic
+        scope = make_cache_key(provider=type(self).__name__, m=self.model, t=max_tokens,
+                               c=context, u=user_scope)
+        return scope, question
+
+    def _get_cached(self, cache_key, semantic=None):
+        """
+        Look up a cached response
+        Args:
+            cache_key: Exact-match key from make_cache_key
+            semantic: (scope, question) from _semantic_lookup for the similarity lookup (None to skip)
+        Returns: str with cached response or None
+        """
+        cached = self._cache.get(cache_key)
+        if cached is None and semantic is not None:
+            scope, question = semantic
+            cached = self._sem_cache.lookup(question, scope)
+            if cached is not None:
+                self._cache.set(cache_key, cached)
+        return cached
+
+    @staticmethod
+    def _parse_tool_arguments(arguments):
+        """Decode tool-call arguments; returns None if the model emitted invalid JSON"""
+        if isinstance(arguments, dict):
+            return arguments
+        try:
+            parsed = orjson.loads(arguments)
+        except (orjson.JSONDecodeError, TypeError):
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    @staticmethod
+    def _execute_tool(tool_executor, tool_name, tool_input):
+        """Execute one tool call; tool_input is None when its arguments could not be parsed"""
+        if tool_input is None:
+            return {
+                'success': False,
+                'error': 'Invalid tool arguments: expected a JSON object',
+                'execution_time_ms': 0,
+                'tool_name': tool_name
+            }
+        return tool_executor.execute_tool(tool_name, tool_input)
+
+    @staticmethod
+    def _execute_tools(tool_executor, calls):
+        """
+        Execute the tool calls of one model turn concurrently
+        Args:
+            tool_executor: ToolExecutor instance
+            calls: list of (tool_name, tool_input) tuples
+        Returns: list of execution results in the same order as calls
+        """
+        if len(calls) == 1:
+            return [BaseAIProvider._execute_tool(tool_executor, *calls[0])]
+        # Called from request threads, which have no running event loop
+        return asyncio.run(BaseAIProvider._aexecute_tools(tool_executor, calls))
+
+    @staticmethod
+    async def _aexecute_tools(tool_executor, calls):
+        """Async variant of _execute_tools; the executor issues the searches concurrently"""
+        valid = [(name, tool_input) for name, tool_input in calls if tool_input is not None]
+        results = iter(await tool_executor.execute_tools(valid) if valid else [])
+        return [
+            next(results) if tool_input is not None
+            else BaseAIProvider._execute_tool(tool_executor, name, None)
+            for name, tool_input in calls
+        ]
+
+    def _store_cached(self, cache_key, text, semantic=None):
+        """Store a non-empty response in the exact (and optionally semantic) cache"""
+        if not text:
+            return
+        self._cache.set(cache_key, text)
+        if semantic is not None:
+            scope, question = semantic
+            self._sem_cache.add(question, text, scope)
+
+    @staticmethod
+    def _build_messages(prompt, context=None):
+        """Chat messages with context as the system message"""
+        messages = []
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _tool_names(tools):
+        """Sorted tuple of tool names (Claude or OpenAI/Ollama format)"""
+        return tuple(sorted(
+            tool['function']['name'] if 'function' in tool else tool['name']
+            for tool in tools
+        ))
 
     @abstractmethod
     def test_connection(self):
@@ -24,19 +227,101 @@ class BaseAIProvider(ABC):
         """
         pass
 
-    @abstractmethod
-    def generate_response(self, prompt, context=None):
+    def generate_response(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS, semantic=None):
         """
         Generate AI response
         Args:
             prompt: The user prompt/question
             context: Optional context/system message
+            max_tokens: Maximum tokens to generate
+            semantic: Optional (user_scope, question) opting in to the semantic cache;
+                      only the question is embedded
         Returns: str with AI response
         """
+        # Identical concurrent requests share one upstream call
+        cache_key = self._response_cache_key(prompt, context, max_tokens)
+        return self._inflight.do(
+            cache_key,
+            lambda: "".join(self.generate_response_stream(prompt, context, max_tokens, semantic)),
+            timeout=INFLIGHT_WAIT_TIMEOUT
+        )
+
+    def generate_response_stream(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS,
+                                 semantic=None):
+        """
+        Generate AI response incrementally
+        Args:
+            prompt: The user prompt/question
+            context: Optional context/system message
+            max_tokens: Maximum tokens to generate
+            semantic: Optional (user_scope, question) opting in to the semantic cache
+        Yields: str chunks of the AI response as they arrive
+        """
+        cache_key = self._response_cache_key(prompt, context, max_tokens)
+        semantic = self._semantic_lookup(semantic, context, max_tokens)
+        cached = self._get_cached(cache_key, semantic)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        for chunk in self._stream_response(prompt, context, max_tokens):
+            parts.append(chunk)
+            yield chunk
+
+        self._store_cached(cache_key, "".join(parts), semantic)
+
+    @abstractmethod
+    def _stream_response(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        Stream a response from the provider API, bypassing the cache
+        Yields: str chunks of the AI response
+        """
+        pass
+
+    async def generate_response_batch(self, prompts, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        Generate responses for many prompts concurrently
+        Args:
+            prompts: list of user prompts
+            context: Optional context/system message shared by all prompts
+            max_tokens: Maximum tokens to generate per prompt
+        Returns: list with a str response (or the raised Exception) per prompt, in order
+        """
+        semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+        # Async clients are bound to the running event loop, so one is opened per batch
+        async with self._async_client() as client:
+            async def generate_one(prompt):
+                cache_key = self._response_cache_key(prompt, context, max_tokens)
+                cached = self._get_cached(cache_key)
+                if cached is not None:
+                    return cached
+
+                async with semaphore:
+                    text = await self._agenerate(client, prompt, context, max_tokens)
+
+                self._store_cached(cache_key, text)
+                return text
+
+            return await asyncio.gather(
+                *(generate_one(prompt) for prompt in prompts),
+                return_exceptions=True
+            )
+
+    @abstractmethod
+    def _async_client(self):
+        """Return a new async API client usable as an async context manager"""
         pass
 
     @abstractmethod
-    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None):
+    async def _agenerate(self, client, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """Generate a single response with an async client, bypassing the cache"""
+        pass
+
+    @abstractmethod
+    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None,
+                                      max_tokens=DEFAULT_MAX_TOKENS):
         """
         Generate response with tool calling support
 
@@ -45,6 +330,7 @@ class BaseAIProvider(ABC):
             context: System context
             tools: List of tool definitions
             tool_executor: ToolExecutor instance to execute tools
+            max_tokens: Maximum tokens to generate per model turn
 
         Returns:
             str with final AI response after tool execution
@@ -57,16 +343,19 @@ class ClaudeProvider(BaseAIProvider):
 
     def __init__(self, api_key):
         super().__init__()
-        self.client = anthropic.Anthropic(api_key=api_key)
+        import anthropic  # Imported lazily so unused SDKs are never loaded
+        self._anthropic = anthropic
+        self.api_key = api_key
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0)
         self.model = "claude-3-5-sonnet-20241022"
         self.supports_tool_calling = True
 
     def test_connection(self):
         """Test Claude API connection"""
         try:
-            message = self.client.messages.create(
+            # Token counting is authenticated but generates (and bills) nothing
+            self.client.beta.messages.count_tokens(
                 model=self.model,
-                max_tokens=10,
                 messages=[{"role": "user", "content": "Hi"}]
             )
             return {
@@ -74,19 +363,19 @@ class ClaudeProvider(BaseAIProvider):
                 "message": "Successfully connected to Claude API",
                 "provider": "Claude"
             }
-        except anthropic.AuthenticationError:
+        except self._anthropic.AuthenticationError:
             return {
                 "success": False,
                 "message": "Invalid API key. Please check your Anthropic API key.",
                 "provider": "Claude"
             }
-        except anthropic.PermissionDeniedError:
+        except self._anthropic.PermissionDeniedError:
             return {
                 "success": False,
                 "message": "Permission denied. Check your API key permissions.",
                 "provider": "Claude"
             }
-        except anthropic.RateLimitError:
+        except self._anthropic.RateLimitError:
             return {
                 "success": False,
                 "message": "Rate limit exceeded. Please try again later.",
@@ -99,99 +388,151 @@ class ClaudeProvider(BaseAIProvider):
                 "provider": "Claude"
             }
 
-    def generate_response(self, prompt, context=None):
-        """Generate response using Claude"""
+    def _stream_response(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """Stream response using Claude"""
         try:
-            # Build the full prompt with context if provided
-            full_prompt = f"{context}\n\n{prompt}" if context else prompt
-
-            message = self.client.messages.create(
+            # Context goes in the system prompt so it forms a stable, cacheable prefix
+            stream = _retry(lambda: self.client.messages.create(
                 model=self.model,
-                max_tokens=2000,
-                messages=[{"role": "user", "content": full_prompt}]
-            )
+                max_tokens=max_tokens,
+                system=context or self._anthropic.NOT_GIVEN,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True
+            ))
 
-            return message.content[0].text
+            for event in stream:
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    yield event.delta.text
 
-        except anthropic.AuthenticationError:
+        except self._anthropic.AuthenticationError:
             raise Exception("AI authentication failed. Please check API key in admin settings.")
-        except anthropic.RateLimitError:
+        except self._anthropic.RateLimitError:
             raise Exception("AI rate limit reached. Please try again later.")
         except Exception as e:
             raise Exception(f"AI service error: {str(e)}")
 
-    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None):
+    def _async_client(self):
+        return self._anthropic.AsyncAnthropic(api_key=self.api_key, max_retries=0)
+
+    async def _agenerate(self, client, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        message = await _aretry(lambda: client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=context or self._anthropic.NOT_GIVEN,
+            messages=[{"role": "user", "content": prompt}]
+        ))
+        return message.content[0].text
+
+    @staticmethod
+    def _log_cache_usage(response):
+        """Log prompt cache hits/writes reported by the API"""
+        usage = getattr(response, 'usage', None)
+        cache_read = getattr(usage, 'cache_read_input_tokens', None)
+        cache_write = getattr(usage, 'cache_creation_input_tokens', None)
+        if cache_read or cache_write:
+            logger.debug("Claude prompt cache: read=%s written=%s tokens", cache_read or 0, cache_write or 0)
+
+    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None,
+                                      max_tokens=DEFAULT_MAX_TOKENS):
         """Generate response with tool calling support"""
         if not tools or not tool_executor:
             # Fallback to regular generation
-            return self.generate_response(prompt, context)
+            return self.generate_response(prompt, context, max_tokens)
 
         try:
             # Build messages
             messages = [{"role": "user", "content": prompt}]
             system_context = context or "You are a helpful subscription management assistant."
 
+            cache_key = make_cache_key(m=self.model, s=system_context, msgs=messages,
+                                       tools=self._tool_names(tools), t=max_tokens)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
+
+            # Mark the system prompt and tool schema as a cacheable prefix
+            system_blocks = [{
+                "type": "text",
+                "text": system_context,
+                "cache_control": {"type": "ephemeral"}
+            }]
+            cached_tools = tools[:-1] + [{**tools[-1], "cache_control": {"type": "ephemeral"}}]
+
             # Initial request with tools
-            response = self.client.messages.create(
+            response = _retry(lambda: self.client.messages.create(
                 model=self.model,
-                max_tokens=2000,
-                system=system_context,
+                max_tokens=max_tokens,
+                system=system_blocks,
                 messages=messages,
-                tools=tools  # Claude's native tools parameter
-            )
+                tools=cached_tools  # Claude's native tools parameter
+            ))
+            self._log_cache_usage(response)
 
             # Check if Claude wants to use tools
+            turns = 0
             while response.stop_reason == "tool_use":
+                if turns == MAX_TOOL_TURNS:
+                    raise AIToolLoopError(f"Exceeded {MAX_TOOL_TURNS} tool-calling turns")
+                turns += 1
+
                 # Extract tool calls
                 tool_results = []
 
-                for content_block in response.content:
-                    if content_block.type == "tool_use":
-                        tool_name = content_block.name
-                        tool_input = content_block.input
-                        tool_id = content_block.id
-
-                        # Execute the tool
-                        execution_result = tool_executor.execute_tool(tool_name, tool_input)
-
-                        if execution_result['success']:
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": tool_id,
-                                "content": json.dumps(execution_result['result'])
-                            })
-                        else:
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": tool_id,
-                                "content": json.dumps({"error": execution_result['error']}),
-                                "is_error": True
-                            })
+                tool_blocks = [block for block in response.content if block.type == "tool_use"]
+
+                # Execute the tools
+                execution_results = self._execute_tools(
+                    tool_executor,
+                    [(block.name, block.input) for block in tool_blocks]
+                )
+
+                for content_block, execution_result in zip(tool_blocks, execution_results):
+                    tool_id = content_block.id
+
+                    if execution_result['success']:
+                        tool_results.append({
+                            "type": "tool_result",
+                            "tool_use_id": tool_id,
+                            "content": orjson.dumps(execution_result['result']).decode()
+                        })
+                    else:
+                        tool_results.append({
+                            "type": "tool_result",
+                            "tool_use_id": tool_id,
+                            "content": orjson.dumps({"error": execution_result['error']}).decode(),
+                            "is_error": True
+                        })
 
                 # Add assistant's response and tool results to conversation
                 messages.append({"role": "assistant", "content": response.content})
                 messages.append({"role": "user", "content": tool_results})
 
                 # Continue conversation
-                response = self.client.messages.create(
+                response = _retry(lambda: self.client.messages.create(
                     model=self.model,
-                    max_tokens=2000,
-                    system=system_context,
+                    max_tokens=max_tokens,
+                    system=system_blocks,
                     messages=messages,
-                    tools=tools
-                )
+                    tools=cached_tools
+                ))
+                self._log_cache_usage(response)
 
             # Extract final text response
             for content_block in response.content:
                 if hasattr(content_block, 'text'):
+                    self._store_cached(cache_key, content_block.text)
                     return content_block.text
 
             return "No response generated"
 
+        except AIToolLoopError:
+            # Already describes the failure (e.g. the turn cap); don\'t wrap it twice
+            raise
         except Exception as e:
-            # Fallback to prompt-based approach
-            print(f"Tool calling failed, falling back to prompts: {e}")
-            return self.generate_response(prompt, context)
+            # Transient errors were already retried on the failing turn; re-prompting
+            # without tools would repeat the whole conversation and discard tool results
+            print(f"Tool calling failed: {e}")
+            raise AIToolLoopError(f"AI tool calling failed: {str(e)}") from e
 
 
 class OpenAIProvider(BaseAIProvider):
@@ -199,126 +540,159 @@ class OpenAIProvider(BaseAIProvider):
 
     def __init__(self, api_key):
         super().__init__()
-        self.client = OpenAI(api_key=api_key)
+        import openai  # Imported lazily so unused SDKs are never loaded
+        self._openai = openai
+        self.api_key = api_key
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0)
         self.model = "gpt-4o-mini"
         self.supports_tool_calling = True
 
     def test_connection(self):
         """Test OpenAI API connection"""
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                max_tokens=10,
-                messages=[{"role": "user", "content": "Hi"}]
-            )
+            # Model lookup is authenticated but generates (and bills) nothing
+            self.client.models.retrieve(self.model)
             return {
                 "success": True,
                 "message": "Successfully connected to OpenAI API",
                 "provider": "OpenAI"
             }
+        except self._openai.AuthenticationError:
+            return {
+                "success": False,
+                "message": "Invalid API key. Please check your OpenAI API key.",
+                "provider": "OpenAI"
+            }
+        except self._openai.RateLimitError:
+            return {
+                "success": False,
+                "message": "Rate limit exceeded. Please try again later.",
+                "provider": "OpenAI"
+            }
         except Exception as e:
-            error_message = str(e)
-            if "authentication" in error_message.lower() or "api_key" in error_message.lower():
-                return {
-                    "success": False,
-                    "message": "Invalid API key. Please check your OpenAI API key.",
-                    "provider": "OpenAI"
-                }
-            elif "rate" in error_message.lower() or "limit" in error_message.lower():
-                return {
-                    "success": False,
-                    "message": "Rate limit exceeded. Please try again later.",
-                    "provider": "OpenAI"
-                }
-            else:
-                return {
-                    "success": False,
-                    "message": f"Connection failed: {error_message}",
-                    "provider": "OpenAI"
-                }
+            return {
+                "success": False,
+                "message": f"Connection failed: {str(e)}",
+                "provider": "OpenAI"
+            }
 
-    def generate_response(self, prompt, context=None):
-        """Generate response using OpenAI"""
+    def _stream_response(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """Stream response using OpenAI"""
         try:
-            messages = []
-            if context:
-                messages.append({"role": "system", "content": context})
-            messages.append({"role": "user", "content": prompt})
+            messages = self._build_messages(prompt, context)
 
-            completion = self.client.chat.completions.create(
+            completion = _retry(lambda: self.client.chat.completions.create(
                 model=self.model,
-                max_tokens=2000,
-                messages=messages
-            )
+                max_tokens=max_tokens,
+                messages=messages,
+                stream=True
+            ))
 
-            return completion.choices[0].message.content
+            for chunk in completion:
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
 
+        except self._openai.AuthenticationError:
+            raise Exception("AI authentication failed. Please check API key in admin settings.")
+        except self._openai.RateLimitError:
+            raise Exception("AI rate limit reached. Please try again later.")
         except Exception as e:
-            error_message = str(e)
-            if "authentication" in error_message.lower() or "api_key" in error_message.lower():
-                raise Exception("AI authentication failed. Please check API key in admin settings.")
-            elif "rate" in error_message.lower() or "limit" in error_message.lower():
-                raise Exception("AI rate limit reached. Please try again later.")
+            raise Exception(f"AI service error: {str(e)}")
+
+    def _async_client(self):
+        return self._openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+
+    async def _agenerate(self, client, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        completion = await _aretry(lambda: client.chat.completions.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            messages=self._build_messages(prompt, context)
+        ))
+        return completion.choices[0].message.content
+
+    def _tool_calls(self, assistant_message):
+        """(tool_name, tool_input) pairs requested by an assistant message"""
+        return [(tool_call.function.name, self._parse_tool_arguments(tool_call.function.arguments))
+                for tool_call in assistant_message.tool_calls]
+
+    @staticmethod
+    def _tool_messages(assistant_message, execution_results):
+        """Tool result messages answering each tool call of an assistant message"""
+        messages = []
+        for tool_call, execution_result in zip(assistant_message.tool_calls, execution_results):
+            if execution_result['success']:
+                content = orjson.dumps(execution_result['result']).decode()
             else:
-                raise Exception(f"AI service error: {error_message}")
+                content = orjson.dumps({"error": execution_result['error']}).decode()
+
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": content
+            })
+        return messages
 
-    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None):
+    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None,
+                                      max_tokens=DEFAULT_MAX_TOKENS):
         """Generate response with tool calling support"""
         if not tools or not tool_executor:
-            return self.generate_response(prompt, context)
+            return self.generate_response(prompt, context, max_tokens)
 
         try:
-            messages = []
-            if context:
-                messages.append({"role": "system", "content": context})
-            messages.append({"role": "user", "content": prompt})
+            messages = self._build_messages(prompt, context)
+
+            cache_key = make_cache_key(m=self.model, msgs=messages,
+                                       tools=self._tool_names(tools), t=max_tokens)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
 
             # Initial request with tools
-            response = self.client.chat.completions.create(
+            response = _retry(lambda: self.client.chat.completions.create(
                 model=self.model,
-                max_tokens=2000,
+                max_tokens=max_tokens,
                 messages=messages,
                 tools=tools  # OpenAI's tools parameter
-            )
+            ))
 
             # Check if model wants to call tools
+            turns = 0
             while response.choices[0].finish_reason == "tool_calls":
+                if turns == MAX_TOOL_TURNS:
+                    raise AIToolLoopError(f"Exceeded {MAX_TOOL_TURNS} tool-calling turns")
+                turns += 1
+
                 assistant_message = response.choices[0].message
                 messages.append(assistant_message)
 
-                # Execute each tool call
-                for tool_call in assistant_message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_input = json.loads(tool_call.function.arguments)
-
-                    # Execute the tool
-                    execution_result = tool_executor.execute_tool(tool_name, tool_input)
-
-                    # Add tool result to messages
-                    if execution_result['success']:
-                        content = json.dumps(execution_result['result'])
-                    else:
-                        content = json.dumps({"error": execution_result['error']})
+                # Execute the tool calls concurrently
+                execution_results = self._execute_tools(
+                    tool_executor, self._tool_calls(assistant_message)
+                )
 
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": content
-                    })
+                # Add tool results to messages
+                messages.extend(self._tool_messages(assistant_message, execution_results))
 
                 # Continue conversation
-                response = self.client.chat.completions.create(
+                response = _retry(lambda: self.client.chat.completions.create(
                     model=self.model,
-                    max_tokens=2000,
+                    max_tokens=max_tokens,
                     messages=messages,
                     tools=tools
-                )
+                ))
 
-            return response.choices[0].message.content
+            text = response.choices[0].message.content
+            self._store_cached(cache_key, text)
+            return text
 
+        except AIToolLoopError:
+            # Already describes the failure (e.g. the turn cap); don\'t wrap it twice
+            raise
         except Exception as e:
-            print(f"Tool calling failed, falling back to prompts: {e}")
-            return self.generate_response(prompt, context)
+            # Transient errors were already retried on the failing turn; re-prompting
+            # without tools would repeat the whole conversation and discard tool results
+            print(f"Tool calling failed: {e}")
+            raise AIToolLoopError(f"AI tool calling failed: {str(e)}") from e
 
 
 class OllamaProvider(BaseAIProvider):
@@ -331,20 +705,134 @@ class OllamaProvider(BaseAIProvider):
         self.timeout = 60
         self.supports_tool_calling = True
 
-    def test_connection(self):
-        """Test Ollama server connection"""
+        # Pooled keep-alive session reused across requests and tool-calling turns
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({'Connection': 'keep-alive'})
+        self._tools_cache = {}
+
+        # Load the model in the background so the first real request skips the cold start
+        threading.Thread(target=self._warmup, daemon=True).start()
+
+    def _warmup(self):
+        """Ask Ollama to load the model into memory (an empty prompt generates nothing)"""
         try:
-            response = requests.post(
+            self._session.post(
                 f"{self.server_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": "Hi",
-                    "stream": False
-                },
-                timeout=10
+                data=orjson.dumps({"model": self.model, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE}),
+                headers={'Content-Type': 'application/json'},
+                timeout=30
+            ).close()
+        except requests.exceptions.RequestException as e:
+            logger.warning("Ollama warmup failed: %s", e)
+
+    def close(self):
+        """Close pooled HTTP connections"""
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        session = getattr(self, '_session', None)
+        if session is not None:
+            session.close()
+
+    def _post(self, path, payload=None, stream=False, body=None):
+        """
+        POST JSON to the Ollama server, retrying transient failures
+        Args:
+            path: API path (e.g. '/api/chat')
+            payload: dict to serialize as the request body
+            stream: Whether to stream the response
+            body: Pre-serialized JSON bytes, used instead of payload
+        """
+        if body is None:
+            body = orjson.dumps(payload)
+
+        def send():
+            response = self._session.post(
+                f"{self.server_url}{path}",
+                data=body,
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout,
+                stream=stream
             )
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError:
+                response.close()
+                raise
+            return response
+
+        return _retry(send)
+
+    def _tools_json(self, tools):
+        """Serialized tool schema, computed once per tools list"""
+        entry = self._tools_cache.get(id(tools))
+        if entry is None or entry[0] is not tools:
+            if len(self._tools_cache) >= 8:
+                self._tools_cache.clear()
+            # Keep a reference to tools so its id cannot be reused while cached
+            entry = (tools, orjson.dumps(tools))
+            self._tools_cache[id(tools)] = entry
+        return entry[1]
+
+    def _chat_body(self, messages, tools_json, max_tokens=DEFAULT_MAX_TOKENS):
+        """Assemble a streaming /api/chat body around the pre-serialized tools"""
+        body = orjson.dumps({
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "options": {"num_predict": max_tokens},
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        })
+        return body[:-1] + b',"tools":' + tools_json + b'}'
+
+    def _chat_turn(self, body):
+        """
+        Run one streamed /api/chat turn
+        Returns: dict shaped like a non-streaming response ({"message": {...}})
+        """
+        content = []
+        tool_calls = []
+
+        with self._post("/api/chat", body=body, stream=True) as response:
+            # Ollama streams one JSON object per line; stop reading at done
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                message = chunk.get('message', {})
+                content.append(message.get('content', ''))
+                tool_calls.extend(message.get('tool_calls') or [])
+                if chunk.get('done'):
+                    break
+
+        message = {"role": "assistant", "content": "".join(content)}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {"message": message}
+
+    def test_connection(self):
+        """Test Ollama server connection"""
+        try:
+            # List installed models instead of running a generation
+            response = self._session.get(f"{self.server_url}/api/tags", timeout=10)
 
             if response.status_code == 200:
+                installed = {model['name'] for model in orjson.loads(response.content).get('models', [])}
+                if self.model not in installed and f"{self.model}:latest" not in installed:
+                    return {
+                        "success": False,
+                        "message": f"Model '{self.model}' not found. Please pull the model first: ollama pull {self.model}",
+                        "provider": "Ollama"
+                    }
                 return {
                     "success": True,
                     "message": f"Successfully connected to Ollama server at {self.server_url}",
@@ -382,25 +870,25 @@ class OllamaProvider(BaseAIProvider):
                 "provider": "Ollama"
             }
 
-    def generate_response(self, prompt, context=None):
-        """Generate response using Ollama"""
+    def _stream_response(self, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        """Stream response using Ollama"""
         try:
-            # Build the full prompt with context if provided
-            full_prompt = f"{context}\n\n{prompt}" if context else prompt
-
-            response = requests.post(
-                f"{self.server_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": full_prompt,
-                    "stream": False
-                },
-                timeout=self.timeout
-            )
-
-            response.raise_for_status()
-            result = response.json()
-            return result.get('response', '')
+            # Chat endpoint keeps the context in a separate system message
+            with self._post("/api/chat", {
+                "model": self.model,
+                "messages": self._build_messages(prompt, context),
+                "stream": True,
+                "options": {"num_predict": max_tokens},
+                "keep_alive": OLLAMA_KEEP_ALIVE
+            }, stream=True) as response:
+                # Ollama streams one JSON object per line
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    yield chunk.get('message', {}).get('content', '')
+                    if chunk.get('done'):
+                        break
 
         except requests.exceptions.ConnectionError:
             raise Exception("Cannot connect to Ollama server. Please check if Ollama is running.")
@@ -409,51 +897,72 @@ class OllamaProvider(BaseAIProvider):
         except Exception as e:
             raise Exception(f"Ollama service error: {str(e)}")
 
-    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None):
+    def _async_client(self):
+        return httpx.AsyncClient(base_url=self.server_url, timeout=self.timeout)
+
+    async def _agenerate(self, client, prompt, context=None, max_tokens=DEFAULT_MAX_TOKENS):
+        async def send():
+            response = await client.post(
+                "/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": self._build_messages(prompt, context),
+                    "stream": False,
+                    "options": {"num_predict": max_tokens},
+                    "keep_alive": OLLAMA_KEEP_ALIVE
+                }
+            )
+            response.raise_for_status()
+            return response
+
+        response = await _aretry(send)
+        return orjson.loads(response.content).get('message', {}).get('content', '')
+
+    def generate_response_with_tools(self, prompt, context=None, tools=None, tool_executor=None,
+                                      max_tokens=DEFAULT_MAX_TOKENS):
         """Generate response with tool calling support"""
         if not tools or not tool_executor:
-            return self.generate_response(prompt, context)
+            return self.generate_response(prompt, context, max_tokens)
 
         try:
             # Build messages for chat endpoint
-            messages = []
-            if context:
-                messages.append({"role": "system", "content": context})
-            messages.append({"role": "user", "content": prompt})
+            messages = self._build_messages(prompt, context)
 
-            # Ollama uses /api/chat endpoint for tool calling
-            response = requests.post(
-                f"{self.server_url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "tools": tools,
-                    "stream": False
-                },
-                timeout=self.timeout
-            )
+            cache_key = make_cache_key(m=self.model, msgs=messages,
+                                       tools=self._tool_names(tools), t=max_tokens)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
 
-            response.raise_for_status()
-            result = response.json()
+            # Serialize the tool schema once for every turn of the loop
+            tools_json = self._tools_json(tools)
+
+            # Ollama uses /api/chat endpoint for tool calling
+            result = self._chat_turn(self._chat_body(messages, tools_json, max_tokens))
 
             # Check if model wants to call tools
+            turns = 0
             while result.get('message', {}).get('tool_calls'):
+                if turns == MAX_TOOL_TURNS:
+                    raise AIToolLoopError(f"Exceeded {MAX_TOOL_TURNS} tool-calling turns")
+                turns += 1
+
                 assistant_message = result['message']
                 messages.append(assistant_message)
 
-                # Execute each tool call
-                for tool_call in assistant_message['tool_calls']:
-                    tool_name = tool_call['function']['name']
-                    tool_input = tool_call['function']['arguments']
-
-                    # Execute the tool
-                    execution_result = tool_executor.execute_tool(tool_name, tool_input)
+                # Execute the tool calls concurrently
+                execution_results = self._execute_tools(
+                    tool_executor,
+                    [(tool_call['function']['name'], self._parse_tool_arguments(tool_call['function']['arguments']))
+                     for tool_call in assistant_message['tool_calls']]
+                )
 
+                for execution_result in execution_results:
                     # Add tool result to messages
                     if execution_result['success']:
-                        content = json.dumps(execution_result['result'])
+                        content = orjson.dumps(execution_result['result']).decode()
                     else:
-                        content = json.dumps({"error": execution_result['error']})
+                        content = orjson.dumps({"error": execution_result['error']}).decode()
 
                     messages.append({
                         "role": "tool",
@@ -461,34 +970,33 @@ class OllamaProvider(BaseAIProvider):
                     })
 
                 # Continue conversation
-                response = requests.post(
-                    f"{self.server_url}/api/chat",
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "tools": tools,
-                        "stream": False
-                    },
-                    timeout=self.timeout
-                )
+                result = self._chat_turn(self._chat_body(messages, tools_json, max_tokens))
 
-                response.raise_for_status()
-                result = response.json()
-
-            return result.get('message', {}).get('content', '')
+            text = result.get('message', {}).get('content', '')
+            self._store_cached(cache_key, text)
+            return text
 
+        except AIToolLoopError:
+            # Already describes the failure (e.g. the turn cap); don\'t wrap it twice
+            raise
         except Exception as e:
-            print(f"Tool calling failed, falling back to prompts: {e}")
-            return self.generate_response(prompt, context)
+            # Transient errors were already retried on the failing turn; re-prompting
+            # without tools would repeat the whole conversation and discard tool results
+            print(f"Tool calling failed: {e}")
+            raise AIToolLoopError(f"AI tool calling failed: {str(e)}") from e
 
 
 class AIProviderFactory:
     """Factory class to create AI provider instances"""
 
+    # Reuse provider instances (and their warm HTTP clients) across requests
+    _instances = LRUCache(maxsize=32)
+    _lock = threading.Lock()
+
     @staticmethod
     def get_provider(provider_name, api_key, ollama_model=None):
         """
-        Create and return an AI provider instance
+        Return a (cached) AI provider instance
 
         Args:
             provider_name: str ('claude', 'openai', or 'ollama')
@@ -502,7 +1010,27 @@ class AIProviderFactory:
             ValueError: If provider_name is invalid
         """
         provider_name = provider_name.lower()
+        key_hash = hashlib.sha256((api_key or '').encode()).hexdigest()
+        # ollama_model only affects Ollama; ignore it so other providers share one instance
+        model = ollama_model if provider_name == 'ollama' else None
+        cache_key = (provider_name, key_hash, model)
+
+        with AIProviderFactory._lock:
+            provider = AIProviderFactory._instances.get(cache_key)
+            if provider is None:
+                provider = AIProviderFactory._build_provider(provider_name, api_key, ollama_model)
+                AIProviderFactory._instances[cache_key] = provider
+            return provider
 
+    @staticmethod
+    def clear_cache():
+        """Drop cached provider instances (e.g. after API key rotation)"""
+        with AIProviderFactory._lock:
+            AIProviderFactory._instances.clear()
+
+    @staticmethod
+    def _build_provider(provider_name, api_key, ollama_model=None):
+        """Create a new AI provider instance"""
         if provider_name == 'claude':
             return ClaudeProvider(api_key)
         elif provider_name == 'openai':
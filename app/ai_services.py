@@ -4,11 +4,30 @@ Handles alternatives finding, spending analysis, recommendations, and chat
 """
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 import os
+import base64
+import hashlib
 import json
-from ai_providers import AIProviderFactory
-
+import logging
+import orjson
+import threading
+from collections import deque
+from itertools import islice
+from decimal import Decimal
+from ai_providers import AIProviderFactory, INFLIGHT_WAIT_TIMEOUT
+from ai_cache import LLMCache, SingleFlight, make_cache_key
+from cachetools import LRUCache
+from cryptography.fernet import Fernet, InvalidToken
+
+# Tool calling needs web_tools (and its scraping dependencies); without it AI runs tool-less
+try:
+    from web_tools import get_tool_definitions_for_provider, ToolExecutor
+except ImportError:
+    get_tool_definitions_for_provider = None
+    ToolExecutor = None
+
+logger = logging.getLogger(__name__)
 
 # Database configuration (same as app.py)
 DB_CONFIG = {
@@ -16,72 +35,230 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 3306)),
     'user': os.getenv('DB_USER', 'root'),
     'password': os.getenv('DB_PASSWORD', 'rootpassword'),
-    'database': os.getenv('DB_NAME', 'subscription_tracker')
+    'database': os.getenv('DB_NAME', 'subscription_tracker'),
+    # Use the C extension for protocol handling and row decoding
+    'use_pure': False
 }
 
+# admin_settings changes rarely; cache it briefly instead of querying on every AI request
+_settings_cache = LLMCache(maxsize=8, ttl=int(os.getenv('SETTINGS_CACHE_TTL', 30)))
+
+# Concurrent identical feature requests share one generation
+_feature_inflight = SingleFlight()
+
+# Parsed results of the JSON features, keyed by the inputs that produced them
+# Callers get shallow copies since routes pop 'status' from the returned dict
+_feature_cache = LLMCache(maxsize=512, ttl=int(os.getenv('AI_FEATURE_CACHE_TTL', 900)))
+
+# Output budget for the JSON features, which must not be cut off mid-array
+STRUCTURED_MAX_TOKENS = 2000
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
 
-def get_db_connection():
-    """Create and return a database connection"""
+def get_db_pool():
+    """Create the shared connection pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="ai",
+                pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+                pool_reset_session=True,
+                **DB_CONFIG
+            )
+        return _pool
+
+
+def get_db_connection(pool=None):
+    """
+    Return a pooled database connection
+    Calling close() on it returns it to the pool
+    """
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        return (pool or get_db_pool()).get_connection()
+    except pooling.PoolError:
+        # Pool exhausted under a burst: fall back to a one-off connection
+        try:
+            return mysql.connector.connect(**DB_CONFIG)
+        except Error:
+            logger.exception("Error connecting to MySQL")
+            return None
+    except Error:
+        logger.exception("Error connecting to MySQL")
         return None
 
 
-def get_ai_settings():
+_fernet = None
+
+
+def init_secret_encryption(secret_key):
     """
-    Fetch AI settings from database
-    Returns: dict with settings or None if AI disabled
+    Set up encryption of the API keys stored in admin_settings
+    Uses SETTINGS_KEY (a Fernet key) if set, otherwise a key derived from secret_key
     """
+    global _fernet
+    key = os.getenv('SETTINGS_KEY')
+    if not key:
+        key = base64.urlsafe_b64encode(hashlib.sha256(secret_key.encode()).digest())
+    _fernet = Fernet(key)
+
+
+def encrypt_secret(value):
+    """Encrypt an API key for storage; empty values are stored as NULL"""
+    if not value:
+        return None
+    return _fernet.encrypt(value.encode()).decode()
+
+
+def decrypt_secret(value):
+    """Decrypt a stored API key; rows saved before encryption hold plaintext and pass through"""
+    if not value:
+        return value
+    try:
+        return _fernet.decrypt(value.encode()).decode()
+    except InvalidToken:
+        if value.startswith('gAAAAA'):
+            logger.error("Stored API key cannot be decrypted; was SETTINGS_KEY or SECRET_KEY changed?")
+            return None
+        return value
+
+
+def invalidate_settings_cache():
+    """Drop cached admin settings; call after admin_settings is updated"""
+    _settings_cache.clear()
+
+
+def _cached(key, loader):
+    """Return the cached result of loader() for key, loading it on a miss or expiry"""
+    value = _settings_cache.get(key)
+    if value is None:
+        value = loader()
+        # Failed loads return None and are retried on the next call
+        if value is not None:
+            _settings_cache.set(key, value)
+    return value
+
+
+def _fetch_ai_settings():
+    """Read the admin_settings row from the database"""
     connection = get_db_connection()
     if not connection:
         return None
 
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM admin_settings WHERE id = 1")
-        settings = cursor.fetchone()
-        cursor.close()
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM admin_settings WHERE id = 1")
+            settings = cursor.fetchone()
+        return settings
+
+    except Error:
+        logger.exception("Error fetching AI settings")
+        return None
+    finally:
         connection.close()
 
-        if not settings or not settings.get('ai_enabled'):
-            return None
 
-        if not settings.get('api_key_encrypted') or settings.get('ai_provider') == 'none':
-            return None
+def get_ai_settings():
+    """
+    Fetch AI settings from database (cached for SETTINGS_CACHE_TTL seconds)
+    Returns: dict with settings or None if AI disabled
+    """
+    return _enabled_ai_settings(_cached('ai_settings', _fetch_ai_settings))
 
-        return settings
 
-    except Error as e:
-        print(f"Error fetching AI settings: {e}")
+def _enabled_ai_settings(settings):
+    """Copy of an admin_settings row, or None if AI is disabled or unconfigured"""
+    if not settings or not settings.get('ai_enabled'):
+        return None
+
+    if not settings.get('api_key_encrypted') or settings.get('ai_provider') == 'none':
+        return None
+
+    # The cached row keeps the ciphertext; callers (and tool executors) get the usable keys
+    settings = dict(settings)
+    settings['api_key_encrypted'] = decrypt_secret(settings['api_key_encrypted'])
+    if not settings['api_key_encrypted']:
         return None
+    settings['search_api_key'] = decrypt_secret(settings.get('search_api_key'))
+    return settings
+
+
+_json_decoder = json.JSONDecoder()
 
 
-def get_tool_settings():
+def _extract_json(text, opener):
     """
-    Get tool calling configuration from database
-    Returns: dict with tool settings or None
+    Decode the first JSON value starting at opener ('[' or '{') in an AI response
+    Parsing stops at the end of that value, so trailing prose or further JSON is ignored
+    Returns: decoded value, or None if there is none or it is malformed
     """
-    connection = get_db_connection()
-    if not connection:
+    start = text.find(opener)
+    if start == -1:
         return None
 
+    # Fast path: the model followed "respond ONLY with JSON"
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT internet_access_enabled, search_method,
-                   search_api_key, tool_calling_enabled
-            FROM admin_settings WHERE id = 1
-        """)
-        settings = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        return settings
-    except Error as e:
-        print(f"Error fetching tool settings: {e}")
-        return None
+        return orjson.loads(text[start:].rstrip())
+    except orjson.JSONDecodeError:
+        pass
+
+    while start != -1:
+        try:
+            return _json_decoder.raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            # An opener inside prose (e.g. "[citation]"); try the next one
+            start = text.find(opener, start + 1)
+    return None
+
+
+def _feature_cache_key(feature, user_id, settings, inputs):
+    """
+    Cache key for a feature result
+    inputs is the subscription data sent to the AI, so any edit to it changes the key
+    """
+    return make_cache_key(
+        feature=feature,
+        user_id=user_id,
+        provider=settings.get('ai_provider'),
+        model=settings.get('ollama_model'),
+        tools=should_use_tools(settings),
+        inputs=inputs
+    )
+
+
+class _ToolExecutorCache(LRUCache):
+    """LRU of ToolExecutors that closes an executor's HTTP session when it is evicted"""
+
+    def popitem(self):
+        key, tool_executor = super().popitem()
+        tool_executor.close()
+        return key, tool_executor
+
+
+_tool_executors = _ToolExecutorCache(maxsize=8)
+_tool_executors_lock = threading.Lock()
+
+
+def get_tools(settings):
+    """
+    Tool definitions and a shared ToolExecutor for the configured provider and search method
+    Executors are reused per (search_method, search_api_key) so their sessions and rate limits persist
+    Returns: (tools, tool_executor)
+    """
+    search_method = settings.get('search_method', 'free_scraping')
+    search_api_key = settings.get('search_api_key')
+    key = (search_method, hashlib.sha256((search_api_key or '').encode()).hexdigest())
+
+    with _tool_executors_lock:
+        tool_executor = _tool_executors.get(key)
+        if tool_executor is None:
+            tool_executor = ToolExecutor(search_method=search_method, search_api_key=search_api_key)
+            _tool_executors[key] = tool_executor
+
+    return get_tool_definitions_for_provider(settings['ai_provider']), tool_executor
 
 
 def should_use_tools(ai_settings):
@@ -94,7 +271,7 @@ def should_use_tools(ai_settings):
     Returns:
         Boolean indicating if tools should be used
     """
-    if not ai_settings:
+    if not ai_settings or ToolExecutor is None:
         return False
 
     # Check if internet access is enabled
@@ -118,118 +295,123 @@ def get_user_subscriptions_context(user_id):
         return ""
 
     try:
-        cursor = connection.cursor(dictionary=True)
-
-        # Get all active subscriptions
-        cursor.execute("""
-            SELECT * FROM subscriptions
-            WHERE user_id = %s AND status = 'active'
-            ORDER BY cost DESC
-        """, (user_id,))
-        subscriptions = cursor.fetchall()
-
-        # Calculate totals
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_count,
-                SUM(CASE
-                    WHEN billing_cycle = 'monthly' THEN cost
-                    WHEN billing_cycle = 'yearly' THEN cost / 12
-                    WHEN billing_cycle = 'weekly' THEN cost * 4.33
-                END) as monthly_cost,
-                SUM(CASE
-                    WHEN billing_cycle = 'monthly' THEN cost * 12
-                    WHEN billing_cycle = 'yearly' THEN cost
-                    WHEN billing_cycle = 'weekly' THEN cost * 52
-                END) as yearly_cost
-            FROM subscriptions
-            WHERE user_id = %s AND status = 'active'
-        """, (user_id,))
-        totals = cursor.fetchone()
-
-        cursor.close()
-        connection.close()
-
-        # Build context string
-        context = f"User's Subscription Portfolio:\n"
-        context += f"Total Active Subscriptions: {totals['total_count']}\n"
-        context += f"Monthly Cost: ${float(totals['monthly_cost'] or 0):.2f}\n"
-        context += f"Yearly Cost: ${float(totals['yearly_cost'] or 0):.2f}\n\n"
-        context += "Individual Subscriptions:\n"
-
-        for sub in subscriptions:
-            context += f"- {sub['name']}: ${sub['cost']}/{sub['billing_cycle']}"
-            if sub['category']:
-                context += f" ({sub['category']})"
-            context += "\n"
+        with connection.cursor(dictionary=True) as cursor:
+            # Get all active subscriptions
+            cursor.execute("""
+                SELECT * FROM subscriptions
+                WHERE user_id = %s AND status = 'active'
+                ORDER BY cost DESC
+            """, (user_id,))
+            # Format rows as they arrive instead of materializing them with fetchall()
+            context = build_subscriptions_context(cursor)
 
         return context
 
-    except Error as e:
-        print(f"Error getting user subscriptions: {e}")
+    except Error:
+        logger.exception("Error getting user subscriptions")
         return ""
+    finally:
+        connection.close()
 
 
-def find_alternatives(subscription_id, user_id):
+def build_subscriptions_context(subscriptions):
     """
-    Find cheaper alternatives for a subscription using AI
-
+    Format active subscription rows (most expensive first) as AI context
     Args:
-        subscription_id: int - ID of the subscription
-        user_id: int - User ID for authorization
-
-    Returns:
-        dict with alternatives array or error
+        subscriptions: iterable of rows, consumed once (a list or an open cursor)
+    Returns: formatted string with subscription data
     """
-    # Check AI settings
-    settings = get_ai_settings()
-    if not settings:
-        return {"error": "AI features are disabled", "status": 403}
+    count = 0
+    monthly_cost = Decimal(0)
+    yearly_cost = Decimal(0)
+    lines = []
+
+    for sub in subscriptions:
+        count += 1
+        # Totals from the generated normalized_*_cost columns (NULL for unknown cycles)
+        monthly_cost += sub['normalized_monthly_cost'] or 0
+        yearly_cost += sub['normalized_yearly_cost'] or 0
+        lines.append(
+            f"- {sub['name']}: ${sub['cost']}/{sub['billing_cycle']}"
+            + (f" ({sub['category']})" if sub['category'] else "")
+        )
 
-    if not settings.get('feature_alternatives'):
-        return {"error": "Alternatives finder feature is disabled", "status": 403}
+    if not count:
+        return EMPTY_SUBSCRIPTIONS_CONTEXT
+
+    parts = [
+        "User's Subscription Portfolio:",
+        f"Total Active Subscriptions: {count}",
+        f"Monthly Cost: ${float(monthly_cost):.2f}",
+        f"Yearly Cost: ${float(yearly_cost):.2f}",
+        "",
+        "Individual Subscriptions:",
+        *lines,
+        ""
+    ]
 
-    # Get subscription details
+    return "\n".join(parts)
+
+
+EMPTY_SUBSCRIPTIONS_CONTEXT = """User's Subscription Portfolio:
+Total Active Subscriptions: 0
+Monthly Cost: $0.00
+Yearly Cost: $0.00
+
+Individual Subscriptions:
+"""
+
+
+def _fetch_ai_bootstrap(user_id):
+    """
+    Read admin_settings and the user's active subscriptions in one round-trip
+    via the sp_ai_bootstrap stored procedure
+    Returns: (settings row, subscription rows), or None if the call failed
+    """
     connection = get_db_connection()
     if not connection:
-        return {"error": "Database connection failed", "status": 503}
+        return None
 
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT * FROM subscriptions
-            WHERE id = %s AND user_id = %s
-        """, (subscription_id, user_id))
-        subscription = cursor.fetchone()
-        cursor.close()
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.callproc('sp_ai_bootstrap', [user_id])
+            results = list(cursor.stored_results())
+            settings = results[0].fetchone()
+            subscriptions = results[1].fetchall()
+        return settings, subscriptions
+
+    except Error:
+        logger.exception("Error calling sp_ai_bootstrap")
+        return None
+    finally:
         connection.close()
 
-        if not subscription:
-            return {"error": "Subscription not found", "status": 404}
 
-        # Create AI provider instance
-        provider = AIProviderFactory.get_provider(
-            settings['ai_provider'],
-            settings['api_key_encrypted'],
-            settings.get('ollama_model')
-        )
+def get_settings_and_context(user_id):
+    """
+    Fetch AI settings and the user's subscription context in a single DB round-trip
+    Returns: (settings, context) as from get_ai_settings and get_user_subscriptions_context
+    """
+    settings = _settings_cache.get('ai_settings')
+    if settings is not None:
+        return _enabled_ai_settings(settings), get_user_subscriptions_context(user_id)
 
-        # Check if we should use tools
-        use_tools = should_use_tools(settings)
+    result = _fetch_ai_bootstrap(user_id)
+    if result is None:
+        return get_ai_settings(), get_user_subscriptions_context(user_id)
 
-        if use_tools and provider.supports_tool_calling:
-            # Tool calling path
-            from web_tools import get_tool_definitions_for_provider, ToolExecutor
+    settings, subscriptions = result
+    if settings is not None:
+        _settings_cache.set('ai_settings', settings)
+    return _enabled_ai_settings(settings), build_subscriptions_context(subscriptions)
 
-            tools = get_tool_definitions_for_provider(settings['ai_provider'])
-            tool_executor = ToolExecutor(
-                search_method=settings.get('search_method', 'free_scraping'),
-                search_api_key=settings.get('search_api_key')
-            )
 
-            prompt = f"""The user has a subscription to: {subscription['name']}
-Current cost: ${subscription['cost']} per {subscription['billing_cycle']}
-Category: {subscription.get('category', 'Unknown')}
+# ============ PROMPTS ============
+# Fixed prompt text, formatted per call with only the varying fields
+
+_ALT_TOOL_PROMPT = """The user has a subscription to: {name}
+Current cost: ${cost} per {cycle}
+Category: {category}
 
 Find 3-5 cheaper or better-value alternatives. Use the available tools to search for current pricing and real alternatives.
 
@@ -243,22 +425,13 @@ After gathering information, respond with a JSON array in this format:
     }}
 ]"""
 
-            context = "You are a subscription cost optimization assistant with access to real-time web search. Use the tools to find current, accurate information about alternatives and pricing."
+_ALT_TOOL_SYSTEM = "You are a subscription cost optimization assistant with access to real-time web search. Use the tools to find current, accurate information about alternatives and pricing."
 
-            # Generate response with tools
-            response = provider.generate_response_with_tools(
-                prompt=prompt,
-                context=context,
-                tools=tools,
-                tool_executor=tool_executor
-            )
-        else:
-            # Fallback to prompt-based approach
-            prompt = f"""You are a subscription cost optimization assistant.
+_ALT_PROMPT = """You are a subscription cost optimization assistant.
 
-The user has a subscription to: {subscription['name']}
-Current cost: ${subscription['cost']} per {subscription['billing_cycle']}
-Category: {subscription.get('category', 'Unknown')}
+The user has a subscription to: {name}
+Current cost: ${cost} per {cycle}
+Category: {category}
 
 Please suggest 3-5 cheaper or better-value alternatives. For each alternative, provide:
 1. Name of the service
@@ -273,102 +446,11 @@ Format your response exactly like this:
         "name": "Alternative Service Name",
         "description": "Brief description of what this service offers",
         "price": "$9.99/month",
-        "differences": "Key differences from {subscription['name']}"
+        "differences": "Key differences from {name}"
     }}
 ]"""
 
-            response = provider.generate_response(prompt)
-
-        # Parse JSON response
-        try:
-            # Try to extract JSON from response
-            json_start = response.find('[')
-            json_end = response.rfind(']') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                alternatives = json.loads(json_str)
-                return {"alternatives": alternatives, "source": "ai", "status": 200}
-            else:
-                # Fallback: return response as text
-                return {
-                    "alternatives": [{
-                        "name": "AI Suggestions",
-                        "description": response,
-                        "price": "Varies",
-                        "differences": "See description for details"
-                    }],
-                    "source": "ai",
-                    "status": 200
-                }
-        except json.JSONDecodeError:
-            # Fallback: return response as single alternative
-            return {
-                "alternatives": [{
-                    "name": "AI Suggestions",
-                    "description": response,
-                    "price": "Varies",
-                    "differences": "See AI response for alternatives"
-                }],
-                "source": "ai",
-                "status": 200
-            }
-
-    except Exception as e:
-        return {"error": str(e), "status": 503}
-
-
-def get_spending_analysis(user_id):
-    """
-    Get AI-powered spending analysis for user
-
-    Args:
-        user_id: int - User ID
-
-    Returns:
-        dict with insights array or error
-    """
-    # Check AI settings
-    settings = get_ai_settings()
-    if not settings:
-        return {"error": "AI features are disabled", "status": 403}
-
-    if not settings.get('feature_analysis'):
-        return {"error": "Analysis feature is disabled", "status": 403}
-
-    try:
-        # Get user subscription context
-        context = get_user_subscriptions_context(user_id)
-
-        if not context or "Total Active Subscriptions: 0" in context:
-            return {
-                "insights": [{
-                    "title": "No Subscriptions Yet",
-                    "description": "Add some subscriptions to get AI-powered insights on your spending patterns."
-                }],
-                "status": 200
-            }
-
-        # Create AI provider instance
-        provider = AIProviderFactory.get_provider(
-            settings['ai_provider'],
-            settings['api_key_encrypted'],
-            settings.get('ollama_model')
-        )
-
-        # Check if we should use tools
-        use_tools = should_use_tools(settings)
-
-        if use_tools and provider.supports_tool_calling:
-            # Tool calling path
-            from web_tools import get_tool_definitions_for_provider, ToolExecutor
-
-            tools = get_tool_definitions_for_provider(settings['ai_provider'])
-            tool_executor = ToolExecutor(
-                search_method=settings.get('search_method', 'free_scraping'),
-                search_api_key=settings.get('search_api_key')
-            )
-
-            prompt = f"""{context}
+_ANALYSIS_TOOL_PROMPT = """{context}
 
 Analyze this user's subscription spending and provide 3-5 key insights. Use tools to check if any services have had recent price increases.
 
@@ -382,17 +464,9 @@ Respond with JSON:
     ]
 }}"""
 
-            system_context = "You are a subscription spending analyst with access to real-time price change information. Use tools when needed."
+_ANALYSIS_TOOL_SYSTEM = "You are a subscription spending analyst with access to real-time price change information. Use tools when needed."
 
-            response = provider.generate_response_with_tools(
-                prompt=prompt,
-                context=system_context,
-                tools=tools,
-                tool_executor=tool_executor
-            )
-        else:
-            # Fallback to prompt-based approach
-            prompt = f"""{context}
+_ANALYSIS_PROMPT = """{context}
 
 Analyze this user's subscription spending and provide 3-5 key insights about their spending patterns, potential areas for cost reduction, and any concerning trends.
 
@@ -407,93 +481,7 @@ Format your response exactly like this:
     ]
 }}"""
 
-            response = provider.generate_response(prompt)
-
-        # Parse JSON response
-        try:
-            # Try to extract JSON from response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                data = json.loads(json_str)
-                return {"insights": data.get('insights', []), "status": 200}
-            else:
-                # Fallback
-                return {
-                    "insights": [{
-                        "title": "AI Analysis",
-                        "description": response
-                    }],
-                    "status": 200
-                }
-        except json.JSONDecodeError:
-            return {
-                "insights": [{
-                    "title": "AI Analysis",
-                    "description": response
-                }],
-                "status": 200
-            }
-
-    except Exception as e:
-        return {"error": str(e), "status": 503}
-
-
-def get_recommendations(user_id):
-    """
-    Get personalized AI recommendations for user
-
-    Args:
-        user_id: int - User ID
-
-    Returns:
-        dict with recommendations array or error
-    """
-    # Check AI settings
-    settings = get_ai_settings()
-    if not settings:
-        return {"error": "AI features are disabled", "status": 403}
-
-    if not settings.get('feature_recommendations'):
-        return {"error": "Recommendations feature is disabled", "status": 403}
-
-    try:
-        # Get user subscription context
-        context = get_user_subscriptions_context(user_id)
-
-        if not context or "Total Active Subscriptions: 0" in context:
-            return {
-                "recommendations": [{
-                    "title": "Start Adding Subscriptions",
-                    "description": "Add your subscriptions to get personalized AI recommendations for optimizing your spending.",
-                    "savings": "N/A",
-                    "priority": "low"
-                }],
-                "status": 200
-            }
-
-        # Create AI provider instance
-        provider = AIProviderFactory.get_provider(
-            settings['ai_provider'],
-            settings['api_key_encrypted'],
-            settings.get('ollama_model')
-        )
-
-        # Check if we should use tools
-        use_tools = should_use_tools(settings)
-
-        if use_tools and provider.supports_tool_calling:
-            # Tool calling path
-            from web_tools import get_tool_definitions_for_provider, ToolExecutor
-
-            tools = get_tool_definitions_for_provider(settings['ai_provider'])
-            tool_executor = ToolExecutor(
-                search_method=settings.get('search_method', 'free_scraping'),
-                search_api_key=settings.get('search_api_key')
-            )
-
-            prompt = f"""{context}
+_REC_TOOL_PROMPT = """{context}
 
 Provide 3-5 personalized recommendations to help reduce costs and optimize value. Use tools to find current deals or pricing.
 
@@ -509,17 +497,9 @@ Respond with JSON:
     ]
 }}"""
 
-            system_context = "You are a subscription optimization advisor with access to real-time pricing and deals. Use tools when helpful."
+_REC_TOOL_SYSTEM = "You are a subscription optimization advisor with access to real-time pricing and deals. Use tools when helpful."
 
-            response = provider.generate_response_with_tools(
-                prompt=prompt,
-                context=system_context,
-                tools=tools,
-                tool_executor=tool_executor
-            )
-        else:
-            # Fallback to prompt-based approach
-            prompt = f"""{context}
+_REC_PROMPT = """{context}
 
 Based on this subscription portfolio, provide 3-5 personalized recommendations to help the user:
 1. Reduce costs
@@ -546,43 +526,342 @@ Format your response exactly like this:
     ]
 }}"""
 
-            response = provider.generate_response(prompt)
+_CHAT_TOOL_SYSTEM = """You are a helpful subscription management assistant with access to real-time web search.
+
+{context}
+
+You can use the available tools to search for current pricing, alternatives, and price changes. Answer the user's questions about their subscriptions, help them optimize costs, suggest alternatives, and provide insights. Be concise, friendly, and helpful."""
+
+_CHAT_SYSTEM = """You are a helpful subscription management assistant.
+
+{context}
+
+Answer the user's questions about their subscriptions, help them optimize costs, suggest alternatives, and provide insights. Be concise, friendly, and helpful."""
+
+
+def _generate_alternatives(settings, subscription, cache_key):
+    """Generate and parse alternatives for one subscription; the result is cached under cache_key"""
+    # Create AI provider instance
+    provider = AIProviderFactory.get_provider(
+        settings['ai_provider'],
+        settings['api_key_encrypted'],
+        settings.get('ollama_model')
+    )
+
+    # Check if we should use tools
+    use_tools = should_use_tools(settings)
+
+    if use_tools and provider.supports_tool_calling:
+        # Tool calling path
+        tools, tool_executor = get_tools(settings)
+
+        prompt = _ALT_TOOL_PROMPT.format(
+            name=subscription['name'],
+            cost=subscription['cost'],
+            cycle=subscription['billing_cycle'],
+            category=subscription.get('category', 'Unknown')
+        )
+
+        context = _ALT_TOOL_SYSTEM
+
+        # Generate response with tools
+        response = provider.generate_response_with_tools(
+            prompt=prompt,
+            context=context,
+            tools=tools,
+            tool_executor=tool_executor,
+            max_tokens=STRUCTURED_MAX_TOKENS
+        )
+    else:
+        # Fallback to prompt-based approach
+        prompt = _ALT_PROMPT.format(
+            name=subscription['name'],
+            cost=subscription['cost'],
+            cycle=subscription['billing_cycle'],
+            category=subscription.get('category', 'Unknown')
+        )
+
+        response = provider.generate_response(prompt, max_tokens=STRUCTURED_MAX_TOKENS)
+
+    # Parse JSON response
+    alternatives = _extract_json(response, '[')
+    if isinstance(alternatives, list):
+        result = {"alternatives": alternatives, "source": "ai", "status": 200}
+        _feature_cache.set(cache_key, result)
+        return result
+
+    # Fallback: return response as single alternative
+    return {
+        "alternatives": [{
+            "name": "AI Suggestions",
+            "description": response,
+            "price": "Varies",
+            "differences": "See AI response for alternatives"
+        }],
+        "source": "ai",
+        "status": 200
+    }
+
+
+def find_alternatives(subscription_id, user_id):
+    """
+    Find cheaper alternatives for a subscription using AI
+
+    Args:
+        subscription_id: int - ID of the subscription
+        user_id: int - User ID for authorization
+
+    Returns:
+        dict with alternatives array or error
+    """
+    # Check AI settings
+    settings = get_ai_settings()
+    if not settings:
+        return {"error": "AI features are disabled", "status": 403}
+
+    if not settings.get('feature_alternatives'):
+        return {"error": "Alternatives finder feature is disabled", "status": 403}
 
-        # Parse JSON response
+    # Get subscription details
+    connection = get_db_connection()
+    if not connection:
+        return {"error": "Database connection failed", "status": 503}
+
+    try:
         try:
-            # Try to extract JSON from response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                data = json.loads(json_str)
-                return {"recommendations": data.get('recommendations', []), "status": 200}
-            else:
-                # Fallback
-                return {
-                    "recommendations": [{
-                        "title": "AI Recommendations",
-                        "description": response,
-                        "savings": "Varies",
-                        "priority": "medium"
-                    }],
-                    "status": 200
-                }
-        except json.JSONDecodeError:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute("""
+                    SELECT * FROM subscriptions
+                    WHERE id = %s AND user_id = %s
+                """, (subscription_id, user_id))
+                # Drain the result so the unbuffered cursor closes cleanly
+                rows = cursor.fetchall()
+                subscription = rows[0] if rows else None
+        finally:
+            connection.close()
+
+        if not subscription:
+            return {"error": "Subscription not found", "status": 404}
+
+        cache_key = _feature_cache_key('alternatives', user_id, settings, {
+            key: subscription.get(key) for key in ('id', 'name', 'cost', 'billing_cycle', 'category')
+        })
+        cached = _feature_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        return dict(_feature_inflight.do(
+            cache_key,
+            lambda: _generate_alternatives(settings, subscription, cache_key),
+            timeout=INFLIGHT_WAIT_TIMEOUT
+        ))
+
+    except Exception as e:
+        return {"error": str(e), "status": 503}
+
+
+def _generate_analysis(settings, context, cache_key):
+    """Generate and parse spending insights for a portfolio context; the result is cached under cache_key"""
+    # Create AI provider instance
+    provider = AIProviderFactory.get_provider(
+        settings['ai_provider'],
+        settings['api_key_encrypted'],
+        settings.get('ollama_model')
+    )
+
+    # Check if we should use tools
+    use_tools = should_use_tools(settings)
+
+    if use_tools and provider.supports_tool_calling:
+        # Tool calling path
+        tools, tool_executor = get_tools(settings)
+
+        prompt = _ANALYSIS_TOOL_PROMPT.format(context=context)
+
+        system_context = _ANALYSIS_TOOL_SYSTEM
+
+        response = provider.generate_response_with_tools(
+            prompt=prompt,
+            context=system_context,
+            tools=tools,
+            tool_executor=tool_executor,
+            max_tokens=STRUCTURED_MAX_TOKENS
+        )
+    else:
+        # Fallback to prompt-based approach
+        prompt = _ANALYSIS_PROMPT.format(context=context)
+
+        response = provider.generate_response(prompt, max_tokens=STRUCTURED_MAX_TOKENS)
+
+    # Parse JSON response
+    data = _extract_json(response, '{')
+    if isinstance(data, dict):
+        result = {"insights": data.get('insights', []), "status": 200}
+        _feature_cache.set(cache_key, result)
+        return result
+
+    # Fallback
+    return {
+        "insights": [{
+            "title": "AI Analysis",
+            "description": response
+        }],
+        "status": 200
+    }
+
+
+def get_spending_analysis(user_id):
+    """
+    Get AI-powered spending analysis for user
+
+    Args:
+        user_id: int - User ID
+
+    Returns:
+        dict with insights array or error
+    """
+    # Check AI settings, loading the subscription context in the same round-trip
+    settings, context = get_settings_and_context(user_id)
+    if not settings:
+        return {"error": "AI features are disabled", "status": 403}
+
+    if not settings.get('feature_analysis'):
+        return {"error": "Analysis feature is disabled", "status": 403}
+
+    try:
+        if not context or context == EMPTY_SUBSCRIPTIONS_CONTEXT:
+            return {
+                "insights": [{
+                    "title": "No Subscriptions Yet",
+                    "description": "Add some subscriptions to get AI-powered insights on your spending patterns."
+                }],
+                "status": 200
+            }
+
+        cache_key = _feature_cache_key('analysis', user_id, settings, context)
+        cached = _feature_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        return dict(_feature_inflight.do(
+            cache_key,
+            lambda: _generate_analysis(settings, context, cache_key),
+            timeout=INFLIGHT_WAIT_TIMEOUT
+        ))
+
+    except Exception as e:
+        return {"error": str(e), "status": 503}
+
+
+def _generate_recommendations(settings, context, cache_key):
+    """Generate and parse recommendations for a portfolio context; the result is cached under cache_key"""
+    # Create AI provider instance
+    provider = AIProviderFactory.get_provider(
+        settings['ai_provider'],
+        settings['api_key_encrypted'],
+        settings.get('ollama_model')
+    )
+
+    # Check if we should use tools
+    use_tools = should_use_tools(settings)
+
+    if use_tools and provider.supports_tool_calling:
+        # Tool calling path
+        tools, tool_executor = get_tools(settings)
+
+        prompt = _REC_TOOL_PROMPT.format(context=context)
+
+        system_context = _REC_TOOL_SYSTEM
+
+        response = provider.generate_response_with_tools(
+            prompt=prompt,
+            context=system_context,
+            tools=tools,
+            tool_executor=tool_executor,
+            max_tokens=STRUCTURED_MAX_TOKENS
+        )
+    else:
+        # Fallback to prompt-based approach
+        prompt = _REC_PROMPT.format(context=context)
+
+        response = provider.generate_response(prompt, max_tokens=STRUCTURED_MAX_TOKENS)
+
+    # Parse JSON response
+    data = _extract_json(response, '{')
+    if isinstance(data, dict):
+        result = {"recommendations": data.get('recommendations', []), "status": 200}
+        _feature_cache.set(cache_key, result)
+        return result
+
+    # Fallback
+    return {
+        "recommendations": [{
+            "title": "AI Recommendations",
+            "description": response,
+            "savings": "Varies",
+            "priority": "medium"
+        }],
+        "status": 200
+    }
+
+
+def get_recommendations(user_id):
+    """
+    Get personalized AI recommendations for user
+
+    Args:
+        user_id: int - User ID
+
+    Returns:
+        dict with recommendations array or error
+    """
+    # Check AI settings, loading the subscription context in the same round-trip
+    settings, context = get_settings_and_context(user_id)
+    if not settings:
+        return {"error": "AI features are disabled", "status": 403}
+
+    if not settings.get('feature_recommendations'):
+        return {"error": "Recommendations feature is disabled", "status": 403}
+
+    try:
+        if not context or context == EMPTY_SUBSCRIPTIONS_CONTEXT:
             return {
                 "recommendations": [{
-                    "title": "AI Recommendations",
-                    "description": response,
-                    "savings": "Varies",
-                    "priority": "medium"
+                    "title": "Start Adding Subscriptions",
+                    "description": "Add your subscriptions to get personalized AI recommendations for optimizing your spending.",
+                    "savings": "N/A",
+                    "priority": "low"
                 }],
                 "status": 200
             }
 
+        cache_key = _feature_cache_key('recommendations', user_id, settings, context)
+        cached = _feature_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        return dict(_feature_inflight.do(
+            cache_key,
+            lambda: _generate_recommendations(settings, context, cache_key),
+            timeout=INFLIGHT_WAIT_TIMEOUT
+        ))
+
     except Exception as e:
         return {"error": str(e), "status": 503}
 
 
+CHAT_HISTORY_LIMIT = 10
+
+
+def _history_tail(conversation_history):
+    """Last CHAT_HISTORY_LIMIT messages, oldest first"""
+    if isinstance(conversation_history, deque) and conversation_history.maxlen == CHAT_HISTORY_LIMIT:
+        return conversation_history
+    tail = list(islice(reversed(conversation_history), CHAT_HISTORY_LIMIT))
+    tail.reverse()
+    return tail
+
+
 def chat_with_ai(message, user_id, conversation_history=None):
     """
     Chat with AI assistant about subscriptions
@@ -590,13 +869,15 @@ def chat_with_ai(message, user_id, conversation_history=None):
     Args:
         message: str - User's message
         user_id: int - User ID
-        conversation_history: list - Optional conversation history
+        conversation_history: list - Optional conversation history; only the last
+            CHAT_HISTORY_LIMIT messages are used, so callers keeping history can pass
+            a deque(maxlen=CHAT_HISTORY_LIMIT) to avoid copying
 
     Returns:
         dict with response or error
     """
-    # Check AI settings
-    settings = get_ai_settings()
+    # Check AI settings, loading the subscription context in the same round-trip
+    settings, context = get_settings_and_context(user_id)
     if not settings:
         return {"error": "AI features are disabled", "status": 403}
 
@@ -604,9 +885,6 @@ def chat_with_ai(message, user_id, conversation_history=None):
         return {"error": "Chat feature is disabled", "status": 403}
 
     try:
-        # Get user subscription context
-        context = get_user_subscriptions_context(user_id)
-
         # Create AI provider instance
         provider = AIProviderFactory.get_provider(
             settings['ai_provider'],
@@ -619,38 +897,23 @@ def chat_with_ai(message, user_id, conversation_history=None):
 
         # Build system message with context
         if use_tools and provider.supports_tool_calling:
-            system_context = f"""You are a helpful subscription management assistant with access to real-time web search.
-
-{context}
-
-You can use the available tools to search for current pricing, alternatives, and price changes. Answer the user's questions about their subscriptions, help them optimize costs, suggest alternatives, and provide insights. Be concise, friendly, and helpful."""
+            system_context = _CHAT_TOOL_SYSTEM.format(context=context)
         else:
-            system_context = f"""You are a helpful subscription management assistant.
-
-{context}
-
-Answer the user's questions about their subscriptions, help them optimize costs, suggest alternatives, and provide insights. Be concise, friendly, and helpful."""
+            system_context = _CHAT_SYSTEM.format(context=context)
 
         # Build full prompt with conversation history
         if conversation_history:
-            full_prompt = system_context + "\n\nConversation history:\n"
-            for msg in conversation_history[-10:]:  # Last 10 messages
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                full_prompt += f"{role.capitalize()}: {content}\n"
-            full_prompt += f"\nUser: {message}\nAssistant:"
+            history = "".join(
+                f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}\n"
+                for msg in _history_tail(conversation_history)
+            )
+            full_prompt = f"{system_context}\n\nConversation history:\n{history}\nUser: {message}\nAssistant:"
         else:
-            full_prompt = system_context + f"\n\nUser: {message}\nAssistant:"
+            full_prompt = f"{system_context}\n\nUser: {message}\nAssistant:"
 
         # Generate response
         if use_tools and provider.supports_tool_calling:
-            from web_tools import get_tool_definitions_for_provider, ToolExecutor
-
-            tools = get_tool_definitions_for_provider(settings['ai_provider'])
-            tool_executor = ToolExecutor(
-                search_method=settings.get('search_method', 'free_scraping'),
-                search_api_key=settings.get('search_api_key')
-            )
+            tools, tool_executor = get_tools(settings)
 
             response = provider.generate_response_with_tools(
                 prompt=message,
@@ -658,8 +921,15 @@ Answer the user's questions about their subscriptions, help them optimize costs,
                 tools=tools,
                 tool_executor=tool_executor
             )
-        else:
+        elif conversation_history:
             response = provider.generate_response(full_prompt)
+        else:
+            # Paraphrases of a first question may share an answer, but only for this user and
+            # this exact portfolio context; replies that depend on history are never matched
+            response = provider.generate_response(
+                full_prompt,
+                semantic=((user_id, system_context), message)
+            )
 
         return {
             "response": response,
@@ -1,16 +1,80 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 import os
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from werkzeug.security import check_password_hash
+from flask_bcrypt import Bcrypt
+from flask_caching import Cache
+from flask_compress import Compress
+from functools import lru_cache, wraps
 import secrets
+import orjson
 from ai_providers import AIProviderFactory
 import ai_services
 
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify via orjson; Decimal and other unknown types fall back to str"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(32))
+app.json = ORJSONProvider(app)
+
+def _load_or_create_secret(path):
+    """Read the dev secret key from path, creating it on first start"""
+    try:
+        with open(path) as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+
+    secret = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secret)
+    return secret
+
+# A stable key keeps sessions valid across restarts and between workers
+SECRET_KEY = os.getenv('SECRET_KEY')
+if not SECRET_KEY:
+    if app.debug or os.getenv('FLASK_ENV') == 'development':
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.flask_secret')
+        SECRET_KEY = _load_or_create_secret(os.getenv('SECRET_KEY_FILE', default_path))
+    else:
+        raise RuntimeError('SECRET_KEY environment variable is required in production')
+app.secret_key = SECRET_KEY
+ai_services.init_secret_encryption(SECRET_KEY)
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS', 12))
+bcrypt = Bcrypt(app)
+
+# Shared Redis cache when REDIS_URL is set, otherwise an in-process cache
+cache = Cache(app, config={
+    'CACHE_TYPE': 'RedisCache' if os.getenv('REDIS_URL') else 'SimpleCache',
+    'CACHE_REDIS_URL': os.getenv('REDIS_URL'),
+    'CACHE_DEFAULT_TIMEOUT': 60
+})
+# Invalidation only reaches every replica through the shared cache
+SHARED_CACHE = bool(os.getenv('REDIS_URL'))
+
+# Compress JSON/HTML responses; brotli for browsers that accept it, gzip otherwise
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 512
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+Compress(app)
 
 # Database configuration
 DB_CONFIG = {
@@ -18,143 +82,397 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 3306)),
     'user': os.getenv('DB_USER', 'root'),
     'password': os.getenv('DB_PASSWORD', 'rootpassword'),
-    'database': os.getenv('DB_NAME', 'subscription_tracker')
+    'database': os.getenv('DB_NAME', 'subscription_tracker'),
+    # Use the C extension for protocol handling and row decoding
+    'use_pure': False
 }
 
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Create the shared connection pool on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="sub_pool",
+                pool_size=int(os.getenv('DB_POOL_SIZE', 20)),
+                pool_reset_session=True,
+                **DB_CONFIG
+            )
+        return _pool
+
 def get_db_connection():
-    """Create and return a database connection"""
+    """
+    Return a pooled database connection
+    Calling close() on it returns it to the pool
+    """
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        return get_db_pool().get_connection()
+    except pooling.PoolError:
+        # Pool exhausted under a burst: fall back to a one-off connection
+        try:
+            return mysql.connector.connect(**DB_CONFIG)
+        except Error as e:
+            print(f"Error connecting to MySQL: {e}")
+            return None
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
+def cache_bucket_version(bucket):
+    """
+    Opaque token for a cache bucket (e.g. one user's data); replaced on invalidation
+    A random token (not a counter) so a restart never reissues an old value
+    """
+    key = f'bucket:{bucket}'
+    version = cache.get(key)
+    if version is None:
+        version = secrets.token_hex(8)
+        cache.set(key, version, timeout=0)
+    return version
+
+def invalidate_cache_bucket(bucket):
+    """Orphan every cached query in bucket; old entries expire on their own"""
+    cache.set(f'bucket:{bucket}', secrets.token_hex(8), timeout=0)
+
+def cached_query(sql, params, bucket, timeout=60):
+    """
+    Run a read query through the shared cache, keyed by bucket version and hash(sql + params)
+    Without REDIS_URL the query always runs: another replica could not invalidate a local copy
+    Returns: list of row dicts, or None if the database is unreachable
+    Raises: Error from the query (failures are not cached)
+    """
+    key = None
+    if SHARED_CACHE:
+        digest = hashlib.blake2b((sql + repr(params)).encode(), digest_size=16).hexdigest()
+        key = f'q:{bucket}:{cache_bucket_version(bucket)}:{digest}'
+        rows = cache.get(key)
+        if rows is not None:
+            return rows
+
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    try:
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    finally:
+        connection.close()
+
+    if key:
+        cache.set(key, rows, timeout=timeout)
+    return rows
+
 def init_db():
     """Initialize database and create tables"""
     connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor()
-            
-            # Users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    is_admin BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Subscriptions table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    name VARCHAR(100) NOT NULL,
-                    cost DECIMAL(10, 2) NOT NULL,
-                    billing_cycle ENUM('monthly', 'yearly', 'weekly') DEFAULT 'monthly',
-                    renewal_date DATE NOT NULL,
-                    category VARCHAR(50),
-                    alternative_notes TEXT,
-                    status ENUM('active', 'cancelled', 'paused') DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )
-            """)
-            
-            # Admin settings table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS admin_settings (
-                    id INT PRIMARY KEY DEFAULT 1,
-                    ai_enabled BOOLEAN DEFAULT FALSE,
-                    ai_provider ENUM('none', 'claude', 'openai', 'ollama') DEFAULT 'none',
-                    api_key_encrypted TEXT,
-                    ollama_model VARCHAR(100) DEFAULT 'llama3.2',
-                    feature_alternatives BOOLEAN DEFAULT FALSE,
-                    feature_chat BOOLEAN DEFAULT FALSE,
-                    feature_analysis BOOLEAN DEFAULT FALSE,
-                    feature_recommendations BOOLEAN DEFAULT FALSE,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Insert default admin settings
-            cursor.execute("""
-                INSERT IGNORE INTO admin_settings (id, ai_enabled, ai_provider)
-                VALUES (1, FALSE, 'none')
-            """)
+            with connection.cursor() as cursor:
+                # Base schema, sent as one multi-statement script in a single round-trip
+                schema_script = """
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(50) UNIQUE NOT NULL,
+                        email VARCHAR(100) UNIQUE NOT NULL,
+                        password_hash VARCHAR(255) NOT NULL,
+                        is_admin BOOLEAN DEFAULT FALSE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
 
-            # Migration: Add ollama_model column if it doesn't exist
-            cursor.execute("""
-                SELECT COUNT(*) as count
-                FROM information_schema.COLUMNS
-                WHERE TABLE_SCHEMA = %s
-                AND TABLE_NAME = 'admin_settings'
-                AND COLUMN_NAME = 'ollama_model'
-            """, (DB_CONFIG['database'],))
-            result = cursor.fetchone()
-            if result[0] == 0:
-                cursor.execute("""
-                    ALTER TABLE admin_settings
-                    ADD COLUMN ollama_model VARCHAR(100) DEFAULT 'llama3.2'
-                    AFTER api_key_encrypted
-                """)
-                print("Added ollama_model column to admin_settings table")
-
-            # Migration: Add tool calling columns
-            tool_columns = [
-                ("internet_access_enabled", "BOOLEAN DEFAULT FALSE"),
-                ("search_method", "ENUM('free_scraping', 'serpapi', 'google_custom') DEFAULT 'free_scraping'"),
-                ("search_api_key", "TEXT"),
-                ("tool_calling_enabled", "BOOLEAN DEFAULT TRUE")
-            ]
-
-            for col_name, col_def in tool_columns:
+                    CREATE TABLE IF NOT EXISTS subscriptions (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        name VARCHAR(100) NOT NULL,
+                        cost DECIMAL(10, 2) NOT NULL,
+                        billing_cycle ENUM('monthly', 'yearly', 'weekly') DEFAULT 'monthly',
+                        renewal_date DATE NOT NULL,
+                        category VARCHAR(50),
+                        alternative_notes TEXT,
+                        status ENUM('active', 'cancelled', 'paused') DEFAULT 'active',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                    );
+
+                    CREATE TABLE IF NOT EXISTS admin_settings (
+                        id INT PRIMARY KEY DEFAULT 1,
+                        ai_enabled BOOLEAN DEFAULT FALSE,
+                        ai_provider ENUM('none', 'claude', 'openai', 'ollama') DEFAULT 'none',
+                        api_key_encrypted TEXT,
+                        ollama_model VARCHAR(100) DEFAULT 'llama3.2',
+                        feature_alternatives BOOLEAN DEFAULT FALSE,
+                        feature_chat BOOLEAN DEFAULT FALSE,
+                        feature_analysis BOOLEAN DEFAULT FALSE,
+                        feature_recommendations BOOLEAN DEFAULT FALSE,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    );
+
+                    INSERT IGNORE INTO admin_settings (id, ai_enabled, ai_provider)
+                    VALUES (1, FALSE, 'none');
+
+                    CREATE TABLE IF NOT EXISTS tool_call_logs (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        tool_name VARCHAR(100) NOT NULL,
+                        input_params JSON,
+                        output_result JSON,
+                        execution_time_ms INT,
+                        status ENUM('success', 'error', 'timeout') DEFAULT 'success',
+                        error_message TEXT,
+                        ai_provider ENUM('claude', 'openai', 'ollama'),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_user_tool (user_id, tool_name),
+                        INDEX idx_created_at (created_at),
+                        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                    )
+                """
+                # Results must be drained before the cursor can be reused
+                for _ in cursor.execute(schema_script, multi=True):
+                    pass
+
+                # Migration: Add ollama_model column if it doesn't exist
                 cursor.execute("""
                     SELECT COUNT(*) as count
                     FROM information_schema.COLUMNS
                     WHERE TABLE_SCHEMA = %s
                     AND TABLE_NAME = 'admin_settings'
-                    AND COLUMN_NAME = %s
-                """, (DB_CONFIG['database'], col_name))
+                    AND COLUMN_NAME = 'ollama_model'
+                """, (DB_CONFIG['database'],))
                 result = cursor.fetchone()
                 if result[0] == 0:
-                    cursor.execute(f"""
+                    cursor.execute("""
                         ALTER TABLE admin_settings
-                        ADD COLUMN {col_name} {col_def}
+                        ADD COLUMN ollama_model VARCHAR(100) DEFAULT 'llama3.2'
+                        AFTER api_key_encrypted
                     """)
-                    print(f"Added {col_name} column to admin_settings table")
+                    print("Added ollama_model column to admin_settings table")
 
-            # Migration: Create tool_call_logs table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tool_call_logs (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    tool_name VARCHAR(100) NOT NULL,
-                    input_params JSON,
-                    output_result JSON,
-                    execution_time_ms INT,
-                    status ENUM('success', 'error', 'timeout') DEFAULT 'success',
-                    error_message TEXT,
-                    ai_provider ENUM('claude', 'openai', 'ollama'),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_user_tool (user_id, tool_name),
-                    INDEX idx_created_at (created_at),
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )
-            """)
-            print("Created tool_call_logs table")
+                # Migration: Add tool calling columns
+                tool_columns = [
+                    ("internet_access_enabled", "BOOLEAN DEFAULT FALSE"),
+                    ("search_method", "ENUM('free_scraping', 'serpapi', 'google_custom') DEFAULT 'free_scraping'"),
+                    ("search_api_key", "TEXT"),
+                    ("tool_calling_enabled", "BOOLEAN DEFAULT TRUE")
+                ]
 
-            connection.commit()
-            cursor.close()
-            connection.close()
+                for col_name, col_def in tool_columns:
+                    cursor.execute("""
+                        SELECT COUNT(*) as count
+                        FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = %s
+                        AND TABLE_NAME = 'admin_settings'
+                        AND COLUMN_NAME = %s
+                    """, (DB_CONFIG['database'], col_name))
+                    result = cursor.fetchone()
+                    if result[0] == 0:
+                        cursor.execute(f"""
+                            ALTER TABLE admin_settings
+                            ADD COLUMN {col_name} {col_def}
+                        """)
+                        print(f"Added {col_name} column to admin_settings table")
+
+                # Migration: Add generated normalized cost columns to subscriptions
+                normalized_columns = [
+                    ("normalized_monthly_cost", """DECIMAL(14, 6) GENERATED ALWAYS AS (CASE billing_cycle
+                        WHEN 'monthly' THEN cost
+                        WHEN 'yearly' THEN cost / 12
+                        WHEN 'weekly' THEN cost * 4.33
+                    END) STORED"""),
+                    ("normalized_yearly_cost", """DECIMAL(14, 6) GENERATED ALWAYS AS (CASE billing_cycle
+                        WHEN 'monthly' THEN cost * 12
+                        WHEN 'yearly' THEN cost
+                        WHEN 'weekly' THEN cost * 52
+                    END) STORED""")
+                ]
+
+                for col_name, col_def in normalized_columns:
+                    cursor.execute("""
+                        SELECT COUNT(*) as count
+                        FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = %s
+                        AND TABLE_NAME = 'subscriptions'
+                        AND COLUMN_NAME = %s
+                    """, (DB_CONFIG['database'], col_name))
+                    result = cursor.fetchone()
+                    if result[0] == 0:
+                        cursor.execute(f"""
+                            ALTER TABLE subscriptions
+                            ADD COLUMN {col_name} {col_def}
+                        """)
+                        print(f"Added {col_name} column to subscriptions table")
+
+                # Migration: Add indexes for the per-user subscription queries
+                subscription_indexes = [
+                    # Subscription list and upcoming renewals, both ordered by renewal date
+                    ("idx_sub_user_renewal", "user_id, renewal_date"),
+                    # Covers the dashboard's per-category GROUP BY; its (user_id, status) prefix
+                    # also serves the AI context query, whose few rows per user sort in memory
+                    ("idx_sub_user_status_category",
+                     "user_id, status, category, normalized_monthly_cost, normalized_yearly_cost")
+                ]
+
+                for index_name, index_columns in subscription_indexes:
+                    cursor.execute("""
+                        SELECT COUNT(*) as count
+                        FROM information_schema.STATISTICS
+                        WHERE TABLE_SCHEMA = %s
+                        AND TABLE_NAME = 'subscriptions'
+                        AND INDEX_NAME = %s
+                    """, (DB_CONFIG['database'], index_name))
+                    result = cursor.fetchone()
+                    if result[0] == 0:
+                        cursor.execute(f"""
+                            CREATE INDEX {index_name}
+                            ON subscriptions ({index_columns})
+                        """)
+                        print(f"Added {index_name} index to subscriptions table")
+
+                # Migration: Drop indexes superseded by idx_sub_user_status_category
+                for index_name in ("idx_user_status_monthly", "idx_user_active_cost"):
+                    cursor.execute("""
+                        SELECT COUNT(*) as count
+                        FROM information_schema.STATISTICS
+                        WHERE TABLE_SCHEMA = %s
+                        AND TABLE_NAME = 'subscriptions'
+                        AND INDEX_NAME = %s
+                    """, (DB_CONFIG['database'], index_name))
+                    result = cursor.fetchone()
+                    if result[0] > 0:
+                        cursor.execute(f"DROP INDEX {index_name} ON subscriptions")
+                        print(f"Dropped redundant {index_name} index from subscriptions table")
+
+                # Migration: Create the AI bootstrap procedure (settings + active subscriptions)
+                cursor.execute("""
+                    SELECT COUNT(*) as count
+                    FROM information_schema.ROUTINES
+                    WHERE ROUTINE_SCHEMA = %s
+                    AND ROUTINE_NAME = 'sp_ai_bootstrap'
+                """, (DB_CONFIG['database'],))
+                result = cursor.fetchone()
+                if result[0] == 0:
+                    cursor.execute("""
+                        CREATE PROCEDURE sp_ai_bootstrap(IN uid INT)
+                        BEGIN
+                            SELECT * FROM admin_settings WHERE id = 1;
+                            SELECT * FROM subscriptions
+                            WHERE user_id = uid AND status = 'active'
+                            ORDER BY cost DESC;
+                        END
+                    """)
+                    print("Created sp_ai_bootstrap procedure")
+
+                connection.commit()
             print("Database initialized successfully")
         except Error as e:
             print(f"Error initializing database: {e}")
+        finally:
+            connection.close()
+
+# Whether any user exists; once True it never flips back, so it is cached for the process lifetime
+_users_exist = False
+
+def _mark_users_exist():
+    global _users_exist
+    _users_exist = True
+
+def users_exist():
+    """
+    Check whether any user account exists
+    Returns: True/False, or None if the database is unreachable
+    """
+    if _users_exist:
+        return True
+
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM users)")
+            exists = bool(cursor.fetchone()[0])
+    finally:
+        connection.close()
+
+    if exists:
+        _mark_users_exist()
+    return exists
+
+# Password hashing
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def _run_hash(fn, *args):
+    """
+    Run a bcrypt call in the hashing process pool so logins use every core
+    HASH_WORKERS=0 hashes on the request thread instead
+    """
+    global _hash_pool
+    workers = int(os.getenv('HASH_WORKERS', os.cpu_count() or 1))
+    if workers <= 0:
+        return fn(*args)
+
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=workers)
+        pool = _hash_pool
+
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A worker died; rebuild the pool on the next call and hash inline now
+        with _hash_pool_lock:
+            if _hash_pool is pool:
+                _hash_pool = None
+        return fn(*args)
+
+def hash_password(password):
+    """Hash a password with bcrypt at BCRYPT_ROUNDS"""
+    return _run_hash(bcrypt.generate_password_hash, password).decode('utf-8')
+
+def verify_password(user, password):
+    """
+    Check a password against a user row
+    Accounts still holding a werkzeug hash are upgraded to bcrypt on successful login
+    """
+    stored = user['password_hash']
+    if stored.startswith('$2'):
+        return _run_hash(bcrypt.check_password_hash, stored, password)
+
+    if not check_password_hash(stored, password):
+        return False
+
+    connection = get_db_connection()
+    if connection:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE users SET password_hash = %s WHERE id = %s",
+                    (hash_password(password), user['id'])
+                )
+                connection.commit()
+        except Error as e:
+            print(f"Error upgrading password hash: {e}")
+        finally:
+            connection.close()
+    return True
+
+@lru_cache(maxsize=None)
+def _render_static_page(template):
+    return render_template(template)
+
+def render_page(template):
+    """
+    Render a page template once per process and reuse the HTML
+    The page templates take no context; data is fetched client-side from /api
+    """
+    if app.debug:
+        return render_template(template)
+    return _render_static_page(template)
 
 # Authentication decorator
 def login_required(f):
@@ -172,16 +490,21 @@ def admin_required(f):
         if 'user_id' not in session:
             return redirect(url_for('login'))
         
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT is_admin FROM users WHERE id = %s", (session['user_id'],))
-            user = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            
-            if not user or not user['is_admin']:
-                return jsonify({'error': 'Admin access required'}), 403
+        # is_admin is stored in the signed session at login; only sessions
+        # created without it need a database lookup
+        if 'is_admin' not in session:
+            connection = get_db_connection()
+            if connection:
+                try:
+                    with connection.cursor(dictionary=True) as cursor:
+                        cursor.execute("SELECT is_admin FROM users WHERE id = %s", (session['user_id'],))
+                        user = cursor.fetchone()
+                finally:
+                    connection.close()
+                session['is_admin'] = bool(user and user['is_admin'])
+        
+        if not session.get('is_admin'):
+            return jsonify({'error': 'Admin access required'}), 403
         
         return f(*args, **kwargs)
     return decorated_function
@@ -199,26 +522,26 @@ def register():
         if not username or not email or not password:
             return jsonify({'error': 'All fields are required'}), 400
         
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                cursor.execute(
-                    "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-                    (username, email, password_hash)
-                )
-                connection.commit()
-                cursor.close()
-                connection.close()
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                        (username, email, password_hash)
+                    )
+                    connection.commit()
                 return jsonify({'message': 'User registered successfully'}), 201
             except Error as e:
                 return jsonify({'error': 'Username or email already exists'}), 400
+            finally:
+                connection.close()
         
         return jsonify({'error': 'Database connection failed'}), 503
     
-    return render_template('register.html')
+    return render_page('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -229,13 +552,14 @@ def login():
         
         connection = get_db_connection()
         if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-            user = cursor.fetchone()
-            cursor.close()
-            connection.close()
+            try:
+                with connection.cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                    user = cursor.fetchone()
+            finally:
+                connection.close()
             
-            if user and check_password_hash(user['password_hash'], password):
+            if user and verify_password(user, password):
                 session['user_id'] = user['id']
                 session['username'] = user['username']
                 session['is_admin'] = user['is_admin']
@@ -245,7 +569,7 @@ def login():
         
         return jsonify({'error': 'Database connection failed'}), 503
     
-    return render_template('login.html')
+    return render_page('login.html')
 
 @app.route('/logout')
 def logout():
@@ -257,18 +581,9 @@ def logout():
 @app.route('/setup', methods=['GET', 'POST'])
 def initial_setup():
     """First-time setup - create admin user"""
-    # Check if users already exist
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT COUNT(*) as user_count FROM users")
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        # If users exist, redirect to login
-        if result['user_count'] > 0:
-            return redirect(url_for('login'))
+    # If users exist, redirect to login
+    if users_exist():
+        return redirect(url_for('login'))
     
     if request.method == 'POST':
         data = request.get_json()
@@ -279,55 +594,45 @@ def initial_setup():
         if not username or not email or not password:
             return jsonify({'error': 'All fields are required'}), 400
         
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                # Create first user as admin
-                cursor.execute(
-                    "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, %s, TRUE)",
-                    (username, email, password_hash)
-                )
-                connection.commit()
+                with connection.cursor() as cursor:
+                    # Create first user as admin
+                    cursor.execute(
+                        "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, %s, TRUE)",
+                        (username, email, password_hash)
+                    )
+                    user_id = cursor.lastrowid
+                    connection.commit()
                 
-                # Auto-login the new admin
-                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-                user = cursor.fetchone()
-                
-                cursor.close()
-                connection.close()
+                _mark_users_exist()
                 
-                # Set session
-                session['user_id'] = user[0]  # id
-                session['username'] = user[1]  # username
+                # Auto-login the new admin
+                session['user_id'] = user_id
+                session['username'] = username
                 session['is_admin'] = True
                 
                 return jsonify({'message': 'Admin user created successfully', 'is_admin': True}), 201
             except Error as e:
                 return jsonify({'error': str(e)}), 500
+            finally:
+                connection.close()
         
         return jsonify({'error': 'Database connection failed'}), 503
     
-    return render_template('setup.html')
+    return render_page('setup.html')
 
 # ============ MAIN ROUTES ============
 
 @app.route('/')
 def index():
     """Redirect to setup if no users exist, otherwise to dashboard"""
-    connection = get_db_connection()
-    if connection:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT COUNT(*) as user_count FROM users")
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        # If no users exist, redirect to setup
-        if result['user_count'] == 0:
-            return redirect(url_for('initial_setup'))
+    # If no users exist, redirect to setup (None means the DB is unreachable)
+    if users_exist() is False:
+        return redirect(url_for('initial_setup'))
     
     # If users exist, require login
     if 'user_id' not in session:
@@ -338,83 +643,163 @@ def index():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html')
+    return render_page('dashboard.html')
 
-@app.route('/health')
-def health():
-    """Health check endpoint"""
+# Last database probe result as (connected, checked_at); replaced atomically by the prober
+_db_health = (False, 0.0)
+_db_prober_started = False
+_db_prober_lock = threading.Lock()
+HEALTH_PROBE_INTERVAL = int(os.getenv('HEALTH_PROBE_INTERVAL', 5))
+HEALTH_STALE_AFTER = int(os.getenv('HEALTH_STALE_AFTER', 30))
+
+def _probe_db():
+    """Ping the database once and record the result"""
+    global _db_health
+    connected = False
     connection = get_db_connection()
     if connection:
-        connection.close()
+        try:
+            connection.ping(reconnect=True)
+            connected = True
+        except Error as e:
+            print(f"Health probe failed: {e}")
+        finally:
+            connection.close()
+    _db_health = (connected, time.time())
+
+def _db_prober():
+    while True:
+        _probe_db()
+        time.sleep(HEALTH_PROBE_INTERVAL)
+
+def _start_db_prober():
+    """Start the background prober on the first health check of this process"""
+    global _db_prober_started
+    with _db_prober_lock:
+        if _db_prober_started:
+            return
+        _db_prober_started = True
+    # Probe synchronously once so the first response is accurate
+    _probe_db()
+    threading.Thread(target=_db_prober, daemon=True).start()
+
+@app.route('/health')
+def health():
+    """Health check endpoint, served from the last background probe"""
+    _start_db_prober()
+    connected, checked_at = _db_health
+    timestamp = datetime.fromtimestamp(checked_at).isoformat()
+    if connected and time.time() - checked_at <= HEALTH_STALE_AFTER:
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp
         }), 200
     else:
         return jsonify({
             'status': 'unhealthy',
             'database': 'disconnected',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': timestamp
         }), 503
 
 # ============ SUBSCRIPTION ROUTES ============
 
+# Columns returned to the client; MySQL formats the dates as ISO strings
+SUBSCRIPTION_COLUMNS = """
+    id, user_id, name, cost, billing_cycle,
+    DATE_FORMAT(renewal_date, '%Y-%m-%d') AS renewal_date,
+    category, alternative_notes, status,
+    DATE_FORMAT(created_at, '%Y-%m-%dT%H:%i:%s') AS created_at
+"""
+
+def etag_matches(etag):
+    """Check If-None-Match against etag"""
+    # Flask-Compress appends ':<algorithm>' to the ETag of compressed bodies
+    client_tags = request.if_none_match.as_set(include_weak=True)
+    return any(tag == etag or tag.startswith(f'{etag}:') for tag in client_tags)
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+def subscriptions_changed(user_id):
+    """Invalidate the user's cached subscription queries, list ETag and dashboard"""
+    invalidate_cache_bucket(f'user:{user_id}')
+    cache.delete_memoized(_compute_dashboard, user_id)
+
 @app.route('/api/subscriptions', methods=['GET', 'POST'])
 @login_required
 def subscriptions():
     if request.method == 'POST':
         data = request.get_json()
+        # A JSON list adds several subscriptions in one round-trip
+        items = data if isinstance(data, list) else [data]
+        if not items or not all(isinstance(item, dict) for item in items):
+            return jsonify({'error': 'Expected a subscription object or a non-empty list of them'}), 400
+        
+        rows = [(
+            session['user_id'],
+            item.get('name'),
+            item.get('cost'),
+            item.get('billing_cycle', 'monthly'),
+            item.get('renewal_date'),
+            item.get('category'),
+            item.get('alternative_notes', ''),
+            item.get('status', 'active')
+        ) for item in items]
         
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    INSERT INTO subscriptions 
-                    (user_id, name, cost, billing_cycle, renewal_date, category, alternative_notes, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    session['user_id'],
-                    data.get('name'),
-                    data.get('cost'),
-                    data.get('billing_cycle', 'monthly'),
-                    data.get('renewal_date'),
-                    data.get('category'),
-                    data.get('alternative_notes', ''),
-                    data.get('status', 'active')
-                ))
-                connection.commit()
-                cursor.close()
-                connection.close()
+                with connection.cursor() as cursor:
+                    # executemany rewrites this into a single multi-row INSERT
+                    cursor.executemany("""
+                        INSERT INTO subscriptions 
+                        (user_id, name, cost, billing_cycle, renewal_date, category, alternative_notes, status)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """, rows)
+                    connection.commit()
+                subscriptions_changed(session['user_id'])
+                if isinstance(data, list):
+                    return jsonify({'message': f'{len(rows)} subscriptions added successfully'}), 201
                 return jsonify({'message': 'Subscription added successfully'}), 201
             except Error as e:
                 return jsonify({'error': str(e)}), 500
+            finally:
+                connection.close()
+        return jsonify({'error': 'Database connection failed'}), 503
     
     elif request.method == 'GET':
-        connection = get_db_connection()
-        if connection:
-            try:
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute("""
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = %s 
-                    ORDER BY renewal_date ASC
-                """, (session['user_id'],))
-                subs = cursor.fetchall()
-                cursor.close()
-                connection.close()
-                
-                # Convert date objects to strings
-                for sub in subs:
-                    if sub['renewal_date']:
-                        sub['renewal_date'] = sub['renewal_date'].isoformat()
-                    if sub['created_at']:
-                        sub['created_at'] = sub['created_at'].isoformat()
-                
-                return jsonify(subs), 200
-            except Error as e:
-                return jsonify({'error': str(e)}), 500
+        # Polling clients revalidate with If-None-Match
+        bucket = f"user:{session['user_id']}"
+        if SHARED_CACHE:
+            # The bucket version changes on every write, so an unchanged list skips the query
+            etag = f"{session['user_id']}:{cache_bucket_version(bucket)}"
+            if etag_matches(etag):
+                return not_modified(etag)
+
+        try:
+            subs = cached_query(f"""
+                SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions 
+                WHERE user_id = %s 
+                ORDER BY renewal_date ASC
+            """, (session['user_id'],), bucket, timeout=int(os.getenv('QUERY_CACHE_TTL', 60)))
+        except Error as e:
+            return jsonify({'error': str(e)}), 500
+
+        if subs is None:
+            return jsonify({'error': 'Database connection failed'}), 503
+        response = jsonify(subs)
+        if not SHARED_CACHE:
+            # A per-process version would go stale on other replicas; tag the data itself
+            digest = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+            etag = f"{session['user_id']}:{digest}"
+            if etag_matches(etag):
+                return not_modified(etag)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
 
 @app.route('/api/subscriptions/<int:sub_id>', methods=['PUT', 'DELETE'])
 @login_required
@@ -424,213 +809,220 @@ def subscription_detail(sub_id):
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    UPDATE subscriptions 
-                    SET name=%s, cost=%s, billing_cycle=%s, renewal_date=%s, 
-                        category=%s, alternative_notes=%s, status=%s
-                    WHERE id=%s AND user_id=%s
-                """, (
-                    data.get('name'),
-                    data.get('cost'),
-                    data.get('billing_cycle'),
-                    data.get('renewal_date'),
-                    data.get('category'),
-                    data.get('alternative_notes'),
-                    data.get('status'),
-                    sub_id,
-                    session['user_id']
-                ))
-                connection.commit()
-                cursor.close()
-                connection.close()
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE subscriptions 
+                        SET name=%s, cost=%s, billing_cycle=%s, renewal_date=%s, 
+                            category=%s, alternative_notes=%s, status=%s
+                        WHERE id=%s AND user_id=%s
+                    """, (
+                        data.get('name'),
+                        data.get('cost'),
+                        data.get('billing_cycle'),
+                        data.get('renewal_date'),
+                        data.get('category'),
+                        data.get('alternative_notes'),
+                        data.get('status'),
+                        sub_id,
+                        session['user_id']
+                    ))
+                    connection.commit()
+                subscriptions_changed(session['user_id'])
                 return jsonify({'message': 'Subscription updated successfully'}), 200
             except Error as e:
                 return jsonify({'error': str(e)}), 500
+            finally:
+                connection.close()
+        return jsonify({'error': 'Database connection failed'}), 503
     
     elif request.method == 'DELETE':
         connection = get_db_connection()
         if connection:
             try:
-                cursor = connection.cursor()
-                cursor.execute("""
-                    DELETE FROM subscriptions 
-                    WHERE id=%s AND user_id=%s
-                """, (sub_id, session['user_id']))
-                connection.commit()
-                cursor.close()
-                connection.close()
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        DELETE FROM subscriptions 
+                        WHERE id=%s AND user_id=%s
+                    """, (sub_id, session['user_id']))
+                    connection.commit()
+                subscriptions_changed(session['user_id'])
                 return jsonify({'message': 'Subscription deleted successfully'}), 200
             except Error as e:
                 return jsonify({'error': str(e)}), 500
+            finally:
+                connection.close()
+        return jsonify({'error': 'Database connection failed'}), 503
 
 # ============ DASHBOARD API ============
 
-@app.route('/api/dashboard')
-@login_required
-def get_dashboard_stats():
+@cache.memoize(timeout=int(os.getenv('DASHBOARD_CACHE_TTL', 60)), unless=lambda: not SHARED_CACHE)
+def _compute_dashboard(user_id):
+    """
+    Dashboard stats for a user, cached per user_id in the shared cache
+    Without REDIS_URL every call recomputes: another replica could not invalidate a local copy
+    Returns: dict, or None if the database is unreachable (not cached)
+    """
     connection = get_db_connection()
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            
-            # Total subscriptions
-            cursor.execute("""
-                SELECT COUNT(*) as total_subscriptions 
-                FROM subscriptions 
-                WHERE user_id = %s AND status = 'active'
-            """, (session['user_id'],))
-            total = cursor.fetchone()
-            
-            # Monthly cost
-            cursor.execute("""
-                SELECT 
-                    SUM(CASE 
-                        WHEN billing_cycle = 'monthly' THEN cost
-                        WHEN billing_cycle = 'yearly' THEN cost / 12
-                        WHEN billing_cycle = 'weekly' THEN cost * 4.33
-                    END) as monthly_cost
-                FROM subscriptions 
-                WHERE user_id = %s AND status = 'active'
-            """, (session['user_id'],))
-            monthly = cursor.fetchone()
-            
-            # Yearly cost
-            cursor.execute("""
-                SELECT 
-                    SUM(CASE 
-                        WHEN billing_cycle = 'monthly' THEN cost * 12
-                        WHEN billing_cycle = 'yearly' THEN cost
-                        WHEN billing_cycle = 'weekly' THEN cost * 52
-                    END) as yearly_cost
-                FROM subscriptions 
-                WHERE user_id = %s AND status = 'active'
-            """, (session['user_id'],))
-            yearly = cursor.fetchone()
-            
-            # Spending by category
+    if not connection:
+        return None
+
+    try:
+        with connection.cursor(dictionary=True) as cursor:
+            # Spending by category; the overall totals are summed from these rows
             cursor.execute("""
                 SELECT 
                     category,
                     COUNT(*) as count,
-                    SUM(CASE 
-                        WHEN billing_cycle = 'monthly' THEN cost
-                        WHEN billing_cycle = 'yearly' THEN cost / 12
-                        WHEN billing_cycle = 'weekly' THEN cost * 4.33
-                    END) as monthly_cost
+                    SUM(normalized_monthly_cost) as monthly_cost,
+                    SUM(normalized_yearly_cost) as yearly_cost
                 FROM subscriptions 
                 WHERE user_id = %s AND status = 'active'
                 GROUP BY category
-            """, (session['user_id'],))
+            """, (user_id,))
             categories = cursor.fetchall()
-            
+
+            total_subscriptions = 0
+            monthly_cost = 0
+            yearly_cost = 0
+            for category in categories:
+                total_subscriptions += category['count']
+                monthly_cost += category['monthly_cost'] or 0
+                yearly_cost += category.pop('yearly_cost') or 0
+        
             # Upcoming renewals (next 7 days)
-            cursor.execute("""
-                SELECT * FROM subscriptions 
+            cursor.execute(f"""
+                SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions 
                 WHERE user_id = %s 
                 AND status = 'active'
                 AND renewal_date BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL 7 DAY)
                 ORDER BY renewal_date ASC
-            """, (session['user_id'],))
+            """, (user_id,))
             renewals = cursor.fetchall()
-            
-            # Convert dates to strings
-            for renewal in renewals:
-                if renewal['renewal_date']:
-                    renewal['renewal_date'] = renewal['renewal_date'].isoformat()
-                if renewal['created_at']:
-                    renewal['created_at'] = renewal['created_at'].isoformat()
-            
-            cursor.close()
-            connection.close()
-            
-            return jsonify({
-                'total_subscriptions': total['total_subscriptions'],
-                'monthly_cost': float(monthly['monthly_cost'] or 0),
-                'yearly_cost': float(yearly['yearly_cost'] or 0),
-                'categories': categories,
-                'upcoming_renewals': renewals
-            }), 200
-        except Error as e:
-            return jsonify({'error': str(e)}), 500
+        
+        
+        return {
+            'total_subscriptions': total_subscriptions,
+            'monthly_cost': float(monthly_cost),
+            'yearly_cost': float(yearly_cost),
+            'categories': categories,
+            'upcoming_renewals': renewals
+        }
+    finally:
+        connection.close()
+
+@app.route('/api/dashboard')
+@login_required
+def get_dashboard_stats():
+    try:
+        stats = _compute_dashboard(session['user_id'])
+    except Error as e:
+        return jsonify({'error': str(e)}), 500
+
+    if stats is None:
+        return jsonify({'error': 'Database connection failed'}), 503
+    return jsonify(stats), 200
 
 # ============ ADMIN ROUTES ============
 
 @app.route('/admin')
 @admin_required
 def admin_panel():
-    return render_template('admin.html')
+    return render_page('admin.html')
+
+@cache.memoize(timeout=int(os.getenv('SETTINGS_CACHE_TTL', 30)), unless=lambda: not SHARED_CACHE)
+def _admin_settings_view():
+    """
+    Admin settings row as shown in the admin panel, with API keys redacted
+    Cached only in the shared cache, so a save is visible to every replica at once
+    Returns: dict, or None if the database is unreachable (not cached)
+    """
+    connection = get_db_connection()
+    if not connection:
+        return None
+
+    try:
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM admin_settings WHERE id = %s", (1,))
+            settings = cursor.fetchone()
+    finally:
+        connection.close()
+
+    # Don't send the actual API keys
+    if settings and settings.get('api_key_encrypted'):
+        settings['api_key_encrypted'] = '***REDACTED***'
+    if settings and settings.get('search_api_key'):
+        settings['search_api_key'] = '***REDACTED***'
+
+    # Ensure ollama_model has a default value
+    if settings and not settings.get('ollama_model'):
+        settings['ollama_model'] = 'llama3.2'
+
+    # Ensure new fields have default values
+    if settings:
+        if 'internet_access_enabled' not in settings:
+            settings['internet_access_enabled'] = False
+        if 'search_method' not in settings:
+            settings['search_method'] = 'free_scraping'
+        if 'tool_calling_enabled' not in settings:
+            settings['tool_calling_enabled'] = True
+
+    return settings
 
 @app.route('/api/admin/settings', methods=['GET', 'PUT'])
 @admin_required
 def admin_settings():
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({'error': 'Database connection failed'}), 503
-    
     if request.method == 'GET':
         try:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM admin_settings WHERE id = 1")
-            settings = cursor.fetchone()
-            cursor.close()
-            connection.close()
-
-            # Don't send the actual API keys
-            if settings and settings.get('api_key_encrypted'):
-                settings['api_key_encrypted'] = '***REDACTED***'
-            if settings and settings.get('search_api_key'):
-                settings['search_api_key'] = '***REDACTED***'
-
-            # Ensure ollama_model has a default value
-            if settings and not settings.get('ollama_model'):
-                settings['ollama_model'] = 'llama3.2'
-
-            # Ensure new fields have default values
-            if settings:
-                if 'internet_access_enabled' not in settings:
-                    settings['internet_access_enabled'] = False
-                if 'search_method' not in settings:
-                    settings['search_method'] = 'free_scraping'
-                if 'tool_calling_enabled' not in settings:
-                    settings['tool_calling_enabled'] = True
-
-            return jsonify(settings), 200
+            settings = _admin_settings_view()
         except Error as e:
             return jsonify({'error': str(e)}), 500
-    
-    elif request.method == 'PUT':
+
+        if settings is None:
+            return jsonify({'error': 'Database connection failed'}), 503
+        return jsonify(settings), 200
+
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 503
+
+    if request.method == 'PUT':
         data = request.get_json()
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                UPDATE admin_settings
-                SET ai_enabled = %s, ai_provider = %s, api_key_encrypted = %s,
-                    ollama_model = %s,
-                    feature_alternatives = %s, feature_chat = %s,
-                    feature_analysis = %s, feature_recommendations = %s,
-                    internet_access_enabled = %s, search_method = %s,
-                    search_api_key = %s
-                WHERE id = 1
-            """, (
-                data.get('ai_enabled', False),
-                data.get('ai_provider', 'none'),
-                data.get('api_key', None),  # In production, encrypt this
-                data.get('ollama_model', 'llama3.2'),
-                data.get('feature_alternatives', False),
-                data.get('feature_chat', False),
-                data.get('feature_analysis', False),
-                data.get('feature_recommendations', False),
-                data.get('internet_access_enabled', False),
-                data.get('search_method', 'free_scraping'),
-                data.get('search_api_key', None)
-            ))
-            connection.commit()
-            cursor.close()
-            connection.close()
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE admin_settings
+                    SET ai_enabled = %s, ai_provider = %s, api_key_encrypted = %s,
+                        ollama_model = %s,
+                        feature_alternatives = %s, feature_chat = %s,
+                        feature_analysis = %s, feature_recommendations = %s,
+                        internet_access_enabled = %s, search_method = %s,
+                        search_api_key = %s
+                    WHERE id = 1
+                """, (
+                    data.get('ai_enabled', False),
+                    data.get('ai_provider', 'none'),
+                    ai_services.encrypt_secret(data.get('api_key')),
+                    data.get('ollama_model', 'llama3.2'),
+                    data.get('feature_alternatives', False),
+                    data.get('feature_chat', False),
+                    data.get('feature_analysis', False),
+                    data.get('feature_recommendations', False),
+                    data.get('internet_access_enabled', False),
+                    data.get('search_method', 'free_scraping'),
+                    ai_services.encrypt_secret(data.get('search_api_key'))
+                ))
+                connection.commit()
+
+            # Drop cached settings and provider clients built with the previous settings
+            cache.delete_memoized(_admin_settings_view)
+            ai_services.invalidate_settings_cache()
+            AIProviderFactory.clear_cache()
+
             return jsonify({'message': 'Settings updated successfully'}), 200
         except Error as e:
             return jsonify({'error': str(e)}), 500
+        finally:
+            connection.close()
 
 # ============ AI FEATURE ROUTES ============
 
@@ -676,12 +1068,8 @@ def test_ai_connection():
         return jsonify({'error': 'Provider and API key required'}), 400
 
     try:
-        # Create provider instance
-        if provider == 'ollama':
-            from ai_providers import OllamaProvider
-            ai_provider = OllamaProvider(api_key, ollama_model)
-        else:
-            ai_provider = AIProviderFactory.get_provider(provider, api_key)
+        # Reuse the cached instance so repeated tests don't start new sessions (or Ollama warmups)
+        ai_provider = AIProviderFactory.get_provider(provider, api_key, ollama_model)
 
         # Test connection
         result = ai_provider.test_connection()
@@ -713,11 +1101,9 @@ def get_ai_status():
         return jsonify({'error': 'Database connection failed'}), 503
 
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM admin_settings WHERE id = 1")
-        settings = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM admin_settings WHERE id = 1")
+            settings = cursor.fetchone()
 
         if not settings:
             return jsonify({
@@ -741,6 +1127,8 @@ def get_ai_status():
 
     except Error as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        connection.close()
 
 @app.route('/api/ai/alternatives/<int:sub_id>', methods=['GET'])
 @login_required
@@ -3,13 +3,33 @@ Web Tools for AI Function Calling
 Provides web search, pricing, reviews, and alternative finding capabilities
 """
 
+import asyncio
+import functools
+import logging
+import operator
+import os
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from lxml import etree
 import json
+import orjson
+from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
 import time
 import re
-from datetime import datetime
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from ai_cache import LLMCache
+
+
+logger = logging.getLogger(__name__)
 
 
 class ToolExecutionError(Exception):
@@ -18,26 +38,198 @@ class ToolExecutionError(Exception):
 
 
 class RateLimiter:
-    """Simple rate limiter for web requests"""
-    def __init__(self, max_calls_per_minute=10):
-        self.max_calls = max_calls_per_minute
-        self.calls = []
+    """
+    Sliding-window rate limiter that adapts to the provider (AIMD)
+    The per-minute budget halves on 429/5xx and grows back by 0.5 after a window of successes
+    """
+    def __init__(self, max_calls_per_minute=10, min_calls=1, ceiling=None):
+        self.max_calls = float(max_calls_per_minute)
+        self.min_calls = min_calls
+        self.ceiling = ceiling or max_calls_per_minute * 3
+        self.calls = deque()  # Monotonic call times, oldest first
+        self._successes = 0
+        self._blocked_until = 0.0  # Set from Retry-After
+        self._lock = threading.Lock()  # Tools may run concurrently
+
+    def _next_delay(self) -> float:
+        """Record a call and return 0 if one may start now, else seconds to wait before asking again"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            # Remove calls older than 1 minute
+            while self.calls and now - self.calls[0] >= 60:
+                self.calls.popleft()
+
+            # The budget may have shrunk below the calls already in the window
+            limit = max(1, int(self.max_calls))
+            if len(self.calls) >= limit:
+                return self.calls[-limit] + 60 - now
+
+            self.calls.append(now)
+            return 0.0
 
     def wait_if_needed(self):
-        now = time.time()
-        # Remove calls older than 1 minute
-        self.calls = [t for t in self.calls if now - t < 60]
+        # Sleep outside the lock so observe() and other callers are not held up
+        while True:
+            delay = self._next_delay()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    async def await_if_needed(self):
+        """Async variant of wait_if_needed that yields to the event loop while waiting"""
+        while True:
+            delay = self._next_delay()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def observe(self, status_code: int, headers, attempt: int = 0) -> bool:
+        """
+        Adjust the budget from a response
+        Returns True if the request was throttled (429) and should be retried
+        """
+        with self._lock:
+            retry_after = _retry_after_seconds(headers)
+
+            if status_code == 429 or status_code >= 500:
+                self.max_calls = max(self.min_calls, self.max_calls * 0.5)
+                self._successes = 0
+                if status_code != 429:
+                    return False
+                delay = retry_after if retry_after is not None else 2 ** attempt
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                return True
+
+            self._successes += 1
+            if self._successes >= int(self.max_calls):
+                self.max_calls = min(self.ceiling, self.max_calls + 0.5)
+                self._successes = 0
+
+            # Quota exhausted but not yet rejected: pause before the next call
+            remaining = headers.get('X-RateLimit-Remaining') or headers.get('X-RateLimit-Remaining-Requests')
+            if remaining == '0':
+                delay = retry_after if retry_after is not None else 1
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            return False
+
+
+def _retry_after_seconds(headers) -> Optional[float]:
+    """Parse Retry-After (seconds or HTTP date), capped at a minute"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), 60.0)
 
-        if len(self.calls) >= self.max_calls:
-            sleep_time = 60 - (now - self.calls[0])
-            if sleep_time > 0:
-                time.sleep(sleep_time)
 
-        self.calls.append(now)
+# Retries of a single search after 429 responses
+RATE_LIMIT_RETRIES = 2
 
+# Prices like "$9.99" or "$15 per month" (the unit is optional)
+_PRICE_RE = re.compile(r'\$\d+\.?\d*\s*(?:per\s+)?(?:month|year|week)?', re.IGNORECASE)
+
+
+# Search results repeat across users and sessions; pricing pages change slowly
+_SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 21600))
+_search_cache = LLMCache(maxsize=512, ttl=_SEARCH_CACHE_TTL)
+
+# Entries past their TTL are kept here with the response's ETag/Last-Modified so the
+# refresh can be a conditional request: {key: (etag, last_modified, results)}
+_search_validators = LLMCache(maxsize=512, ttl=_SEARCH_CACHE_TTL * 4)
+
+
+def _conditional_headers(stale: Optional[tuple]) -> Dict:
+    """If-None-Match / If-Modified-Since headers revalidating a stale entry"""
+    if not stale:
+        return {}
+    etag, last_modified, _ = stale
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def _response_validators(headers, stale: Optional[tuple]) -> Optional[tuple]:
+    """(etag, last_modified) from a response, keeping the stale ones a 304 may omit"""
+    etag = headers.get('ETag') or (stale[0] if stale else None)
+    last_modified = headers.get('Last-Modified') or (stale[1] if stale else None)
+    if not etag and not last_modified:
+        return None
+    return etag, last_modified
 
-# Global rate limiter
-rate_limiter = RateLimiter(max_calls_per_minute=10)
+
+def _store_search(key, results: List[Dict], validators: Optional[tuple]):
+    _search_cache.set(key, results)
+    if validators:
+        _search_validators.set(key, (*validators, results))
+
+
+def cached_search(fn):
+    """
+    Serve search_web(query, max_results) from the shared TTL cache; hits skip the rate limiter
+    On a miss, fn(self, query, max_results, stale) returns (results, validators); stale is the
+    expired entry to revalidate when the backend supports conditional requests
+    """
+    @functools.wraps(fn)
+    def wrapper(self, query: str, max_results: int = 5) -> List[Dict]:
+        key = (type(self).__name__, query, max_results)
+        results = _search_cache.get(key)
+        if results is None:
+            stale = _search_validators.get(key) if self.conditional_requests else None
+            results, validators = fn(self, query, max_results, stale)
+            _store_search(key, results, validators if self.conditional_requests else None)
+        return list(results)
+    return wrapper
+
+
+def acached_search(fn):
+    """Async counterpart of cached_search for asearch_web(client, query, max_results)"""
+    @functools.wraps(fn)
+    async def wrapper(self, client, query: str, max_results: int = 5) -> List[Dict]:
+        key = (type(self).__name__, query, max_results)
+        results = _search_cache.get(key)
+        if results is None:
+            stale = _search_validators.get(key) if self.conditional_requests else None
+            results, validators = await fn(self, client, query, max_results, stale)
+            _store_search(key, results, validators if self.conditional_requests else None)
+        return list(results)
+    return wrapper
+
+
+# (title, snippet, url) of a search result in one call
+_result_fields = operator.itemgetter('title', 'snippet', 'url')
+
+
+def now_iso() -> str:
+    """Current UTC time in ISO 8601, as stamped on tool results"""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_http_session(headers: Optional[Dict] = None) -> requests.Session:
+    """
+    Build a requests.Session whose connection pool keeps sockets (and TLS sessions) alive
+    Transient 5xx responses are retried with backoff; 429s are left to the backend's RateLimiter
+    """
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
 # ============ TOOL DEFINITIONS ============
@@ -116,259 +308,388 @@ TOOL_DEFINITIONS = {
 }
 
 
-# ============ FREE WEB SCRAPING IMPLEMENTATION ============
+# ============ SEARCH QUERIES ============
+# (query, max_results) for each higher-level tool; shared by all search backends
+
+def pricing_search(service_name: str, region: str = "US") -> tuple:
+    return f"{service_name} subscription pricing {region} 2026", 3
+
+
+def alternatives_search(service_name: str, category: str) -> tuple:
+    return f"alternatives to {service_name} {category} subscription 2026", 5
+
+
+def price_changes_search(service_name: str) -> tuple:
+    return f"{service_name} price increase 2025 2026", 3
+
 
-class FreeWebSearch:
-    """Free web scraping implementation using requests + BeautifulSoup"""
+def fused_pricing_search(service_name: str, region: str = "US") -> tuple:
+    """One broader query answering both get_subscription_pricing and check_price_changes"""
+    return f"{service_name} subscription pricing {region} 2026 price increase", 8
+
+
+_PRICE_NEWS_RE = re.compile(r'\b(?:increase|increases|raise|raises|hike|hikes|change|changes)\b', re.IGNORECASE)
+
+
+def split_fused_results(results: List[Dict]) -> tuple:
+    """
+    Split fused search results into (pricing, price news) sources, three of each at most
+    Either side falls back to the top results when nothing matches its filter
+    """
+    def text(result):
+        return f"{result.get('title', '')} {result.get('snippet', '')}"
+
+    pricing = [r for r in results if _PRICE_RE.search(text(r))][:3] or results[:3]
+    news = [r for r in results if _PRICE_NEWS_RE.search(text(r))][:3] or results[:3]
+    return pricing, news
+
+
+def create_async_client(headers: Optional[Dict] = None) -> httpx.AsyncClient:
+    """
+    Build an httpx.AsyncClient for one batch of concurrent tool calls
+    HTTP/2 lets concurrent calls to the same host share one connection; gzip/br are negotiated by default
+    Clients are bound to the event loop they run on, so they are not shared across batches
+    """
+    # Limits and http2 belong to the transport when one is passed explicitly
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+    return httpx.AsyncClient(headers=headers, timeout=10.0, transport=transport)
+
+
+# ============ SEARCH BACKENDS ============
+
+class SearchBackend(ABC):
+    """
+    Shared search tool logic over a pooled HTTP session and the shared result cache
+    Subclasses only describe the search request and how to parse its response
+    """
+
+    headers: Optional[Dict] = None
+    timeout = 10
+    # Prefix for ToolExecutionError messages
+    error_label = "Web search"
+    # Parse responses off the event loop (for CPU-heavy HTML parsing)
+    parse_in_thread = False
+    # Revalidate expired cache entries with If-None-Match / If-Modified-Since
+    conditional_requests = True
+    # Each backend class shares one limiter across its instances
+    rate_limiter: RateLimiter
 
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        self.timeout = 10
+        self.session = create_http_session(self.headers)
 
-    def search_web(self, query: str, max_results: int = 5) -> List[Dict]:
-        """
-        Search web using DuckDuckGo HTML (no API key needed)
-        Returns list of search results
-        """
-        rate_limiter.wait_if_needed()
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
 
-        try:
-            # Use DuckDuckGo HTML (more reliable than scraping Google)
-            url = f"https://html.duckduckgo.com/html/?q={requests.utils.quote(query)}"
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
+    @abstractmethod
+    def _request(self, query: str, max_results: int) -> tuple:
+        """Return (url, params) for a search request"""
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            results = []
+    @abstractmethod
+    def _parse_results(self, response, max_results: int) -> List[Dict]:
+        """Turn a search response (requests or httpx) into title/url/snippet dicts"""
 
-            # Parse DuckDuckGo results
-            for result_div in soup.find_all('div', class_='result')[:max_results]:
-                title_elem = result_div.find('a', class_='result__a')
-                snippet_elem = result_div.find('a', class_='result__snippet')
+    @cached_search
+    def search_web(self, query: str, max_results: int = 5, stale: Optional[tuple] = None) -> tuple:
+        """Run a search and return list of search results"""
+        try:
+            url, params = self._request(query, max_results)
+            headers = _conditional_headers(stale)
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                self.rate_limiter.wait_if_needed()
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+                if not self.rate_limiter.observe(response.status_code, response.headers, attempt):
+                    break
+            validators = _response_validators(response.headers, stale)
+            if response.status_code == 304 and stale:
+                return stale[2], validators
+            response.raise_for_status()
+            return self._parse_results(response, max_results), validators
 
-                if title_elem:
-                    results.append({
-                        'title': title_elem.get_text(strip=True),
-                        'url': title_elem.get('href', ''),
-                        'snippet': snippet_elem.get_text(strip=True) if snippet_elem else ''
-                    })
+        except Exception as e:
+            raise ToolExecutionError(f"{self.error_label} failed: {str(e)}")
 
-            return results
+    @acached_search
+    async def asearch_web(self, client: httpx.AsyncClient, query: str, max_results: int = 5,
+                          stale: Optional[tuple] = None) -> tuple:
+        """Async variant of search_web"""
+        try:
+            url, params = self._request(query, max_results)
+            headers = _conditional_headers(stale)
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await self.rate_limiter.await_if_needed()
+                response = await client.get(url, params=params, headers=headers)
+                logger.debug("%s answered over %s", response.url.host, response.http_version)
+                if not self.rate_limiter.observe(response.status_code, response.headers, attempt):
+                    break
+            validators = _response_validators(response.headers, stale)
+            if response.status_code == 304 and stale:
+                return stale[2], validators
+            response.raise_for_status()
+            if self.parse_in_thread:
+                results = await asyncio.to_thread(self._parse_results, response, max_results)
+            else:
+                results = self._parse_results(response, max_results)
+            return results, validators
 
         except Exception as e:
-            raise ToolExecutionError(f"Web search failed: {str(e)}")
+            raise ToolExecutionError(f"{self.error_label} failed: {str(e)}")
 
-    def get_subscription_pricing(self, service_name: str, region: str = "US") -> Dict:
+    def get_subscription_pricing(self, service_name: str, region: str = "US",
+                                 timestamp: Optional[str] = None) -> Dict:
         """Get pricing info by searching and parsing results"""
-        query = f"{service_name} subscription pricing {region} 2026"
-        results = self.search_web(query, max_results=3)
+        results = self.search_web(*pricing_search(service_name, region))
+        return self._pricing_result(service_name, region, results, timestamp)
+
+    async def aget_subscription_pricing(self, client: httpx.AsyncClient, service_name: str,
+                                        region: str = "US", timestamp: Optional[str] = None) -> Dict:
+        results = await self.asearch_web(client, *pricing_search(service_name, region))
+        return self._pricing_result(service_name, region, results, timestamp)
+
+    def find_alternatives(self, service_name: str, category: str) -> List[Dict]:
+        """Find alternatives by searching"""
+        results = self.search_web(*alternatives_search(service_name, category))
+        return self._alternatives_result(results)
+
+    async def afind_alternatives(self, client: httpx.AsyncClient, service_name: str,
+                                 category: str) -> List[Dict]:
+        results = await self.asearch_web(client, *alternatives_search(service_name, category))
+        return self._alternatives_result(results)
+
+    def check_price_changes(self, service_name: str, timestamp: Optional[str] = None) -> Dict:
+        """Check for price changes"""
+        results = self.search_web(*price_changes_search(service_name))
+        return self._price_changes_result(service_name, results, timestamp)
+
+    async def acheck_price_changes(self, client: httpx.AsyncClient, service_name: str,
+                                   timestamp: Optional[str] = None) -> Dict:
+        results = await self.asearch_web(client, *price_changes_search(service_name))
+        return self._price_changes_result(service_name, results, timestamp)
 
-        # Extract pricing information from results
-        pricing_info = {
+    def _pricing_result(self, service_name: str, region: str, results: List[Dict],
+                        timestamp: Optional[str] = None) -> Dict:
+        return {
             'service': service_name,
             'region': region,
             'sources': results,
             'estimated_price': self._extract_price_from_results(results),
-            'last_updated': datetime.now().isoformat()
+            'last_updated': timestamp or now_iso()
         }
 
-        return pricing_info
+    @staticmethod
+    def _alternatives_result(results: List[Dict]) -> List[Dict]:
+        # Parse results to extract alternative services
+        return [
+            {'title': title, 'description': snippet, 'source_url': url}
+            for title, snippet, url in map(_result_fields, results)
+        ]
 
-    def _extract_price_from_results(self, results: List[Dict]) -> Optional[str]:
-        """Try to extract price from search result snippets"""
-        price_pattern = r'\$\d+\.?\d*\s*(?:per\s+)?(?:month|year|week)?'
+    @staticmethod
+    def _price_changes_result(service_name: str, results: List[Dict],
+                              timestamp: Optional[str] = None) -> Dict:
+        return {
+            'service': service_name,
+            'has_recent_changes': len(results) > 0,
+            'news': results,
+            'checked_at': timestamp or now_iso()
+        }
 
+    @staticmethod
+    def _extract_price_from_results(results: List[Dict]) -> Optional[str]:
+        """Try to extract price from search result snippets"""
         for result in results:
-            text = f"{result.get('title', '')} {result.get('snippet', '')}"
-            matches = re.findall(price_pattern, text, re.IGNORECASE)
-            if matches:
-                return matches[0]
+            # Title first, then snippet, as before; search() stops at the first match
+            for text in (result.get('title', ''), result.get('snippet', '')):
+                match = _PRICE_RE.search(text)
+                if match:
+                    return match.group(0)
 
         return None
 
-    def find_alternatives(self, service_name: str, category: str) -> List[Dict]:
-        """Find alternatives by searching"""
-        query = f"alternatives to {service_name} {category} subscription 2026"
-        results = self.search_web(query, max_results=5)
 
-        # Parse results to extract alternative services
-        alternatives = []
-        for result in results:
-            alternatives.append({
-                'title': result['title'],
-                'description': result['snippet'],
-                'source_url': result['url']
-            })
+# ============ FREE WEB SCRAPING IMPLEMENTATION ============
 
-        return alternatives
+class FreeWebSearch(SearchBackend):
+    """Free web scraping implementation using requests + BeautifulSoup (lxml parser)"""
 
-    def check_price_changes(self, service_name: str) -> Dict:
-        """Check for price changes"""
-        query = f"{service_name} price increase 2025 2026"
-        results = self.search_web(query, max_results=3)
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+    parse_in_thread = True
+    rate_limiter = RateLimiter(max_calls_per_minute=10)
 
-        return {
-            'service': service_name,
-            'has_recent_changes': len(results) > 0,
-            'news': results,
-            'checked_at': datetime.now().isoformat()
-        }
+    def _request(self, query: str, max_results: int) -> tuple:
+        # Use DuckDuckGo HTML (more reliable than scraping Google; no API key needed)
+        return f"https://html.duckduckgo.com/html/?q={requests.utils.quote(query)}", None
 
+    def _parse_results(self, response, max_results: int) -> List[Dict]:
+        """Parse DuckDuckGo HTML results in the parse process pool"""
+        return _run_parse(_parse_ddg_html, response.content, max_results)
 
-# ============ PAID API IMPLEMENTATIONS ============
 
-class SerpAPISearch:
-    """SerpAPI implementation (paid)"""
+# Feed size for the incremental DuckDuckGo parse
+_PARSE_CHUNK_SIZE = 16384
 
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.base_url = "https://serpapi.com/search"
 
-    def search_web(self, query: str, max_results: int = 5) -> List[Dict]:
-        """Search using SerpAPI"""
-        rate_limiter.wait_if_needed()
+def _has_class(elem, name: str) -> bool:
+    return name in (elem.get('class') or '').split()
 
-        params = {
-            'api_key': self.api_key,
-            'q': query,
-            'num': max_results
-        }
 
-        try:
-            response = requests.get(self.base_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+def _element_text(elem) -> str:
+    # Same text as BeautifulSoup's get_text(strip=True)
+    return ''.join(text.strip() for text in elem.itertext())
 
-            results = []
-            for item in data.get('organic_results', [])[:max_results]:
+
+def _parse_ddg_html(html: bytes, max_results: int) -> List[Dict]:
+    """
+    Parse DuckDuckGo HTML results, stopping once max_results result divs are read
+    The page is fed to lxml in chunks, so the rest of the page (~30 results) is never parsed
+    Falls back to a full BeautifulSoup parse when the page yields fewer results
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag='div')
+    results = []
+    seen = 0
+
+    for offset in range(0, len(html), _PARSE_CHUNK_SIZE):
+        parser.feed(html[offset:offset + _PARSE_CHUNK_SIZE])
+        for _, result_div in parser.read_events():
+            if not _has_class(result_div, 'result'):
+                continue
+            seen += 1
+            title_elem = snippet_elem = None
+            for link in result_div.iter('a'):
+                if title_elem is None and _has_class(link, 'result__a'):
+                    title_elem = link
+                elif snippet_elem is None and _has_class(link, 'result__snippet'):
+                    snippet_elem = link
+
+            if title_elem is not None:
                 results.append({
-                    'title': item.get('title', ''),
-                    'url': item.get('link', ''),
-                    'snippet': item.get('snippet', '')
+                    'title': _element_text(title_elem),
+                    'url': title_elem.get('href', ''),
+                    'snippet': _element_text(snippet_elem) if snippet_elem is not None else ''
                 })
+            if seen >= max_results:
+                return results
 
-            return results
-
-        except Exception as e:
-            raise ToolExecutionError(f"SerpAPI search failed: {str(e)}")
+    return _parse_ddg_html_full(html, max_results)
 
-    def get_subscription_pricing(self, service_name: str, region: str = "US") -> Dict:
-        """Get pricing using SerpAPI"""
-        query = f"{service_name} subscription pricing {region} 2026"
-        results = self.search_web(query, max_results=3)
 
-        return {
-            'service': service_name,
-            'region': region,
-            'sources': results,
-            'last_updated': datetime.now().isoformat()
-        }
+def _parse_ddg_html_full(html: bytes, max_results: int) -> List[Dict]:
+    """Parse DuckDuckGo HTML results (raw bytes; lxml detects the encoding)"""
+    soup = BeautifulSoup(html, 'lxml')
+    results = []
 
-    def find_alternatives(self, service_name: str, category: str) -> List[Dict]:
-        """Find alternatives using SerpAPI"""
-        query = f"alternatives to {service_name} {category} subscription 2026"
-        results = self.search_web(query, max_results=5)
+    for result_div in soup.find_all('div', class_='result', limit=max_results):
+        title_elem = result_div.find('a', class_='result__a')
+        snippet_elem = result_div.find('a', class_='result__snippet')
 
-        alternatives = []
-        for result in results:
-            alternatives.append({
-                'title': result['title'],
-                'description': result['snippet'],
-                'source_url': result['url']
+        if title_elem:
+            results.append({
+                'title': title_elem.get_text(strip=True),
+                'url': title_elem.get('href', ''),
+                'snippet': snippet_elem.get_text(strip=True) if snippet_elem else ''
             })
 
-        return alternatives
+    return results
 
-    def check_price_changes(self, service_name: str) -> Dict:
-        """Check for price changes using SerpAPI"""
-        query = f"{service_name} price increase 2025 2026"
-        results = self.search_web(query, max_results=3)
 
-        return {
-            'service': service_name,
-            'has_recent_changes': len(results) > 0,
-            'news': results,
-            'checked_at': datetime.now().isoformat()
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _run_parse(fn, *args):
+    """
+    Run a CPU-bound HTML parse in a process pool so concurrent searches parse in parallel
+    SEARCH_PARSE_WORKERS=0 parses in the calling thread instead
+    """
+    global _parse_pool
+    workers = int(os.getenv('SEARCH_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+    if workers <= 0:
+        return fn(*args)
+
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=workers)
+        pool = _parse_pool
+
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A worker died; rebuild the pool on the next call and parse inline now
+        with _parse_pool_lock:
+            if _parse_pool is pool:
+                _parse_pool = None
+        return fn(*args)
+
+
+# ============ PAID API IMPLEMENTATIONS ============
+
+class SerpAPISearch(SearchBackend):
+    """SerpAPI implementation (paid)"""
+
+    error_label = "SerpAPI search"
+    # SerpAPI answers every request in full; validators would only add headers
+    conditional_requests = False
+    rate_limiter = RateLimiter(max_calls_per_minute=10)
+
+    def __init__(self, api_key: str):
+        super().__init__()
+        self.api_key = api_key
+        self.base_url = "https://serpapi.com/search"
+
+    def _request(self, query: str, max_results: int) -> tuple:
+        return self.base_url, {
+            'api_key': self.api_key,
+            'q': query,
+            'num': max_results
         }
 
+    def _parse_results(self, response, max_results: int) -> List[Dict]:
+        results = []
+        # orjson decodes the raw bytes directly
+        for item in orjson.loads(response.content).get('organic_results', [])[:max_results]:
+            results.append({
+                'title': item.get('title', ''),
+                'url': item.get('link', ''),
+                'snippet': item.get('snippet', '')
+            })
+        return results
+
 
-class GoogleCustomSearch:
+class GoogleCustomSearch(SearchBackend):
     """Google Custom Search API implementation (paid)"""
 
+    error_label = "Google Custom Search"
+    rate_limiter = RateLimiter(max_calls_per_minute=10)
+
     def __init__(self, api_key: str, search_engine_id: str = None):
+        super().__init__()
         self.api_key = api_key
         self.search_engine_id = search_engine_id or "default"
         self.base_url = "https://www.googleapis.com/customsearch/v1"
 
-    def search_web(self, query: str, max_results: int = 5) -> List[Dict]:
-        """Search using Google Custom Search"""
-        rate_limiter.wait_if_needed()
-
-        params = {
+    def _request(self, query: str, max_results: int) -> tuple:
+        return self.base_url, {
             'key': self.api_key,
             'cx': self.search_engine_id,
             'q': query,
             'num': min(max_results, 10)  # Google Custom Search max is 10
         }
 
-        try:
-            response = requests.get(self.base_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            results = []
-            for item in data.get('items', [])[:max_results]:
-                results.append({
-                    'title': item.get('title', ''),
-                    'url': item.get('link', ''),
-                    'snippet': item.get('snippet', '')
-                })
-
-            return results
-
-        except Exception as e:
-            raise ToolExecutionError(f"Google Custom Search failed: {str(e)}")
-
-    def get_subscription_pricing(self, service_name: str, region: str = "US") -> Dict:
-        """Get pricing using Google Custom Search"""
-        query = f"{service_name} subscription pricing {region} 2026"
-        results = self.search_web(query, max_results=3)
-
-        return {
-            'service': service_name,
-            'region': region,
-            'sources': results,
-            'last_updated': datetime.now().isoformat()
-        }
-
-    def find_alternatives(self, service_name: str, category: str) -> List[Dict]:
-        """Find alternatives using Google Custom Search"""
-        query = f"alternatives to {service_name} {category} subscription 2026"
-        results = self.search_web(query, max_results=5)
-
-        alternatives = []
-        for result in results:
-            alternatives.append({
-                'title': result['title'],
-                'description': result['snippet'],
-                'source_url': result['url']
+    def _parse_results(self, response, max_results: int) -> List[Dict]:
+        results = []
+        for item in orjson.loads(response.content).get('items', [])[:max_results]:
+            results.append({
+                'title': item.get('title', ''),
+                'url': item.get('link', ''),
+                'snippet': item.get('snippet', '')
             })
-
-        return alternatives
-
-    def check_price_changes(self, service_name: str) -> Dict:
-        """Check for price changes using Google Custom Search"""
-        query = f"{service_name} price increase 2025 2026"
-        results = self.search_web(query, max_results=3)
-
-        return {
-            'service': service_name,
-            'has_recent_changes': len(results) > 0,
-            'news': results,
-            'checked_at': datetime.now().isoformat()
-        }
+        return results
 
 
 # ============ TOOL EXECUTOR ============
@@ -396,6 +717,10 @@ class ToolExecutor:
         else:
             raise ValueError(f"Unknown search method: {search_method}")
 
+    def close(self):
+        """Release the search implementation's pooled connections"""
+        self.search_impl.close()
+
     def execute_tool(self, tool_name: str, tool_input: Dict) -> Dict:
         """
         Execute a tool and return results
@@ -451,11 +776,146 @@ class ToolExecutor:
             }
 
 
+    async def aexecute_tool(self, client: httpx.AsyncClient, tool_name: str, tool_input: Dict,
+                            fused: Optional[asyncio.Future] = None,
+                            timestamp: Optional[str] = None) -> Dict:
+        """
+        Async variant of execute_tool; the search goes through client
+        fused: pending fused pricing search shared with a same-service sibling call
+        timestamp: ISO time stamped on pricing/price-change results (defaults to now)
+        """
+        start_time = time.time()
+        impl = self.search_impl
+
+        try:
+            if fused is not None and tool_name in FUSABLE_TOOLS:
+                pricing, news = split_fused_results(await fused)
+                service_name = tool_input['service_name']
+                if tool_name == "get_subscription_pricing":
+                    result = impl._pricing_result(service_name, tool_input.get('region', 'US'),
+                                                  pricing, timestamp)
+                else:
+                    result = impl._price_changes_result(service_name, news, timestamp)
+            elif tool_name == "search_web":
+                result = await impl.asearch_web(
+                    client, tool_input['query'], tool_input.get('max_results', 5)
+                )
+            elif tool_name == "get_subscription_pricing":
+                result = await impl.aget_subscription_pricing(
+                    client, tool_input['service_name'], tool_input.get('region', 'US'), timestamp
+                )
+            elif tool_name == "find_alternatives":
+                result = await impl.afind_alternatives(
+                    client, tool_input['service_name'], tool_input['category']
+                )
+            elif tool_name == "check_price_changes":
+                result = await impl.acheck_price_changes(client, tool_input['service_name'], timestamp)
+            else:
+                raise ToolExecutionError(f"Unknown tool: {tool_name}")
+
+            execution_time = int((time.time() - start_time) * 1000)
+
+            return {
+                'success': True,
+                'result': result,
+                'execution_time_ms': execution_time,
+                'tool_name': tool_name
+            }
+
+        except Exception as e:
+            execution_time = int((time.time() - start_time) * 1000)
+            return {
+                'success': False,
+                'error': str(e),
+                'execution_time_ms': execution_time,
+                'tool_name': tool_name
+            }
+
+    async def execute_tools(self, calls: List[tuple]) -> List[Dict]:
+        """
+        Execute several tool calls concurrently over one pooled async client
+
+        Args:
+            calls: list of (tool_name, tool_input) tuples
+
+        Returns:
+            List of tool execution results in the same order as calls
+        """
+        # One timestamp for the whole batch
+        timestamp = now_iso()
+        async with create_async_client(self.search_impl.headers) as client:
+            fused = self._fuse_searches(client, calls)
+            return await asyncio.gather(*(
+                self.aexecute_tool(client, name, tool_input,
+                                   fused.get(_fusion_key(name, tool_input)), timestamp)
+                for name, tool_input in calls
+            ))
+
+    def _fuse_searches(self, client: httpx.AsyncClient, calls: List[tuple]) -> Dict:
+        """
+        Start one fused search per service that has both pricing and price-change calls
+        Returns: {(service_name, region): Task} shared by those calls
+        """
+        tools_by_service = {}
+        for name, tool_input in calls:
+            key = _fusion_key(name, tool_input)
+            if key:
+                tools_by_service.setdefault(key, set()).add(name)
+
+        return {
+            key: asyncio.ensure_future(
+                self.search_impl.asearch_web(client, *fused_pricing_search(*key))
+            )
+            for key, tools in tools_by_service.items()
+            if tools == FUSABLE_TOOLS
+        }
+
+
+# Tools answered together by fused_pricing_search when called for the same service
+FUSABLE_TOOLS = {"get_subscription_pricing", "check_price_changes"}
+
+
+def _fusion_key(tool_name: str, tool_input: Dict) -> Optional[tuple]:
+    """(service_name, region) for a fusable call, else None"""
+    if tool_name not in FUSABLE_TOOLS or not tool_input.get('service_name'):
+        return None
+    # check_price_changes has no region; it joins the default-region pricing call
+    return tool_input['service_name'], tool_input.get('region', 'US')
+
+
 # ============ HELPER FUNCTIONS ============
 
+def _format_tool(tool_def: Dict, provider: str) -> Dict:
+    if provider == 'claude':
+        # Claude uses tools parameter with specific format
+        return {
+            "name": tool_def["name"],
+            "description": tool_def["description"],
+            "input_schema": tool_def["input_schema"]
+        }
+
+    # OpenAI uses functions parameter with different format; Ollama uses the same one
+    return {
+        "type": "function",
+        "function": {
+            "name": tool_def["name"],
+            "description": tool_def["description"],
+            "parameters": tool_def["input_schema"]
+        }
+    }
+
+
+# TOOL_DEFINITIONS is static, so each provider's view is built once at import
+_PROVIDER_VIEWS = {
+    provider: [_format_tool(tool_def, provider) for tool_def in TOOL_DEFINITIONS.values()]
+    for provider in ('claude', 'openai', 'ollama')
+}
+
+
 def get_tool_definitions_for_provider(provider: str) -> List[Dict]:
     """
     Get tool definitions formatted for specific AI provider
+    The list is shared by all callers and must not be mutated
 
     Args:
         provider: 'claude', 'openai', or 'ollama'
@@ -463,44 +923,7 @@ def get_tool_definitions_for_provider(provider: str) -> List[Dict]:
     Returns:
         List of tool definitions in provider-specific format
     """
-    if provider == 'claude':
-        # Claude uses tools parameter with specific format
-        return [
-            {
-                "name": tool_def["name"],
-                "description": tool_def["description"],
-                "input_schema": tool_def["input_schema"]
-            }
-            for tool_def in TOOL_DEFINITIONS.values()
-        ]
-
-    elif provider == 'openai':
-        # OpenAI uses functions parameter with different format
-        tools = []
-        for tool_def in TOOL_DEFINITIONS.values():
-            tools.append({
-                "type": "function",
-                "function": {
-                    "name": tool_def["name"],
-                    "description": tool_def["description"],
-                    "parameters": tool_def["input_schema"]
-                }
-            })
-        return tools
-
-    elif provider == 'ollama':
-        # Ollama uses similar format to OpenAI
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool_def["name"],
-                    "description": tool_def["description"],
-                    "parameters": tool_def["input_schema"]
-                }
-            }
-            for tool_def in TOOL_DEFINITIONS.values()
-        ]
-
-    else:
+    try:
+        return _PROVIDER_VIEWS[provider]
+    except KeyError:
         raise ValueError(f"Unknown provider: {provider}")